@@ -1,102 +1,302 @@
-import requests
 from fastapi import Depends, HTTPException, APIRouter
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
-from app.database.session import get_db
+from app.database.session import db_context, get_db
 from app.database import crud
-from app.huggingface.manager import ModelManager
-from app.models.document import DocumentStatusEnum, DocumentEventsEnum, UploadDocumentResponse, QAResponse, QARequest, UploadDocumentRequest
+from app.huggingface.batcher import EmbeddingBatcher
+from app.huggingface.cache import embedding_cache
+from app.huggingface.embedding import EmbeddingService
+from app.huggingface.inference import InferenceQueueFull, inference_executor
+from app.metrics import timed
+from app.retrieval.fusion import hybrid_search
+from app.retrieval.memory_index import memory_index
+from app.retrieval.result_cache import result_cache
+from app.models.document import (
+    DocumentStatusEnum,
+    DocumentEventsEnum,
+    DocumentStatusResponse,
+    IndexProgress,
+    BatchUploadRequest,
+    BatchUploadResponse,
+    UploadDocumentResponse,
+    QAResponse,
+    QARequest,
+    QABatchRequest,
+    QABatchResult,
+    RetrievalOptions,
+    RetrievalModeEnum,
+    UploadDocumentRequest,
+    SearchRequest,
+    SearchResponse,
+    SearchHit,
+)
 from app.settings import settings
-from app.tasks.document import move_document_forward
-import os
+from app.tasks.document import move_document_forward, move_documents_forward
+from app.tasks.progress import get_progress
+import asyncio
 import logging
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-model_manager = ModelManager()
-embedding_model = model_manager.get_model()
+# uploading a known url again only reloads documents that are not being processed
+RELOADABLE_STATUSES = (DocumentStatusEnum.INDEXED, DocumentStatusEnum.FAILED)
+# while a document is re-indexed its previous chunks stay in place until the new ones are swapped in
+SEARCHABLE_STATUSES = (
+    DocumentStatusEnum.INDEXED,
+    DocumentStatusEnum.LOAD,
+    DocumentStatusEnum.READY_TO_BE_INDEXED,
+    DocumentStatusEnum.EXTRACTING_EMBEDDINGS,
+)
 
+NOT_FOUND = "Document not found or not yet processed."
 
-def pad_or_truncate_vector(vector, target_length):
-    """Pad or truncate the vector to the target length."""
-    if len(vector) > target_length:
-        return vector[:target_length]
-    elif len(vector) < target_length:
-        return np.pad(vector, (0, target_length - len(vector)), "constant")
-    return vector
+embedding_service = EmbeddingService()
+embedding_batcher = EmbeddingBatcher(embedding_service)
 
 
-@router.post("/upload/", response_model=UploadDocumentResponse)
-async def upload_document(request: UploadDocumentRequest, db_session: Session = Depends(get_db)) -> JSONResponse:
-    """Endpoint for uploading a document from a URL and processing it."""
+def search_document(db_session: Session, document_id: int, query_embedding) -> list:
+    """Vector search of one document: hot documents in memory, everything else in postgres on the vector index."""
+    chunks = None
+    if settings.memory_index_enabled:
+        chunks = memory_index.search(db_session, document_id, query_embedding, settings.qa_top_k)
+    if chunks is None:
+        chunks = crud.search_chunks(db_session, document_id=document_id, query_vector=query_embedding, k=settings.qa_top_k)
+    return chunks
+
 
-    # Fetch and save the file locally from the URL
-    os.makedirs(settings.pdfs_data_dir, exist_ok=True)
-    response = requests.get(request.url)
-    logger.info(f"response of pdf url request {response=}")
-    file_name = request.url.split("/")[-1]
-    logger.info(f"file_name {file_name=}")
-    file_path = f"{settings.pdfs_data_dir}/{file_name}"
-    logger.info(f"file_path {file_path=}")
+def search_document_in_session(document_id: int, query_embedding) -> list:
+    with db_context() as db_session:
+        return search_document(db_session, document_id, query_embedding)
 
-    with open(file_path, "wb") as f:
-        f.write(response.content)
 
-    logger.info(f"File saved at {file_path}. Exists: {os.path.isfile(file_path)}")
+async def retrieve_chunks(options: RetrievalOptions, query: str, query_embedding, document_id: int, db_session: Optional[Session] = None) -> list:
+    """The top chunks of a document for a query, hybrid mode fuses full-text and vector candidates.
 
-    # Insert document record into the database
-    document_id = crud.insert_document(db_session, file_path)
-    logger.info("document inserted")
+    Without `db_session` the vector search opens its own session, so several searches can run at once.
+    """
+    if options.mode == RetrievalModeEnum.HYBRID:
+        return await hybrid_search(
+            query,
+            query_embedding,
+            k=settings.qa_top_k,
+            candidate_depth=options.candidate_depth,
+            vector_weight=options.vector_weight,
+            lexical_weight=options.lexical_weight,
+            document_ids=[document_id],
+        )
+    if db_session is None:
+        return await run_in_threadpool(search_document_in_session, document_id, query_embedding)
+    return await run_in_threadpool(search_document, db_session, document_id, query_embedding)
 
-    # Move document forward in the processing pipeline
-    move_document_forward(document_id, DocumentEventsEnum.LOAD_REQUEST.value)
 
-    # Retrieve the updated document information
-    document = crud.get_document(db_session, document_id)
+@router.post("/upload/", response_model=UploadDocumentResponse, status_code=202)
+async def upload_document(request: UploadDocumentRequest, db_session: Session = Depends(get_db)) -> JSONResponse:
+    """Endpoint for uploading a document from a URL, answered before the download.
+
+    The extraction stage downloads the URL, conditionally if it was downloaded before, so uploading
+    an unchanged document again costs a 304. Poll GET /documents/{document_id} for the status.
+    """
+    document = await run_in_threadpool(crud.get_document_by_url, db_session, request.url)
+    if document:
+        document_id = document.id
+        reload = document.status in RELOADABLE_STATUSES
+    else:
+        document_id = await run_in_threadpool(crud.insert_document, db_session, None, request.tags, request.url)
+        logger.info(f"Document {document_id} inserted for {request.url}")
+        reload = True
+
+    # Move document forward in the processing pipeline, a document being processed is left alone
+    if reload:
+        await run_in_threadpool(move_document_forward, document_id, DocumentEventsEnum.LOAD_REQUEST.value)
+
+    document = await run_in_threadpool(crud.get_document, db_session, document_id)
     if document:
         upload_response = UploadDocumentResponse(document_id=document_id, status=document.status)
-        return JSONResponse(content=jsonable_encoder(upload_response), status_code=200)
+        return JSONResponse(content=jsonable_encoder(upload_response), status_code=202)
     else:
         raise HTTPException(status_code=400, detail="Unable to upload and process the document.")
 
 
+@router.post("/upload/batch", response_model=BatchUploadResponse, status_code=202)
+async def upload_documents(request: BatchUploadRequest, db_session: Session = Depends(get_db)) -> JSONResponse:
+    """Endpoint for uploading many URLs at once: one lookup, one INSERT of the new documents and their LOAD_REQUEST messages sent together."""
+    urls = list(dict.fromkeys(request.urls))
+    documents = await run_in_threadpool(crud.get_documents_by_urls, db_session, urls)
+    document_ids = {url: document.id for url, document in documents.items()}
+    statuses = {document.id: document.status for document in documents.values()}
+
+    inserted = await run_in_threadpool(crud.insert_documents, db_session, [url for url in urls if url not in documents], request.tags)
+    document_ids.update(inserted)
+    statuses.update((document_id, DocumentStatusEnum.ADDED) for document_id in inserted.values())
+    logger.info(f"Batch upload of {len(urls)} urls, {len(inserted)} new documents")
+
+    new_ids = set(inserted.values())
+    reloads = {document_id: status for document_id, status in statuses.items() if status in RELOADABLE_STATUSES or document_id in new_ids}
+    await run_in_threadpool(move_documents_forward, reloads, DocumentEventsEnum.LOAD_REQUEST.value)
+    response = BatchUploadResponse(documents=[UploadDocumentResponse(document_id=document_ids[url], status=statuses[document_ids[url]]) for url in request.urls])
+    return JSONResponse(content=jsonable_encoder(response), status_code=202)
+
+
+@router.get("/documents/{document_id}", response_model=DocumentStatusResponse)
+async def document_status(document_id: int, db_session: Session = Depends(get_db)) -> JSONResponse:
+    """Endpoint for the processing status of a document, with page progress while it is indexed in shards."""
+    document = await run_in_threadpool(crud.get_document, db_session, document_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found.")
+
+    progress = await run_in_threadpool(get_progress, document_id) if document.status == DocumentStatusEnum.LOAD else None
+    response = DocumentStatusResponse(document_id=document_id, status=document.status, progress=IndexProgress(**progress) if progress else None)
+    return JSONResponse(content=jsonable_encoder(response), status_code=200)
+
+
 @router.post("/qa/", response_model=QAResponse)
 async def question_answer(request: QARequest, db_session: Session = Depends(get_db)) -> JSONResponse:
     """Endpoint for answering a query based on the processed document."""
 
     # Retrieve the document based on URL (assuming the document was already processed)
-    document = crud.get_document_by_url(db_session, request.url)
-    if not document or document.status != DocumentStatusEnum.INDEXED:
-        raise HTTPException(status_code=404, detail="Document not found or not yet processed.")
+    with timed("document_lookup"):
+        document = await run_in_threadpool(crud.get_document_by_url, db_session, request.url)
+    if not document or document.status not in SEARCHABLE_STATUSES:
+        raise HTTPException(status_code=404, detail=NOT_FOUND)
 
-    # Embed the query using the same embedding model
-    query_embedding = embedding_model(request.query)[0]
-    query_embedding = np.array(query_embedding).flatten()
+    async def answer() -> list:
+        # Embed the query using the same embedding model, batched with concurrent queries
+        try:
+            with timed("query_embed"):
+                query_embedding = await embedding_batcher.embed(request.query)
+        except InferenceQueueFull:
+            raise HTTPException(status_code=503, detail="Too many pending queries, retry later.")
 
-    # Determine the target length (e.g., based on the first chunk or a set value)
-    target_length = 16000  # Assuming this is your standard chunk length
+        with timed("search"):
+            chunks = await retrieve_chunks(request, request.query, query_embedding, document.id, db_session)
+        if not chunks and document.status != DocumentStatusEnum.INDEXED:
+            raise HTTPException(status_code=404, detail=NOT_FOUND)
+        return [chunk.text for chunk in chunks]
 
-    # Adjust the query embedding to match the target length
-    query_embedding = pad_or_truncate_vector(query_embedding, target_length)
+    # Repeated questions are answered from the result cache, keyed by the document version
+    if settings.qa_cache_enabled:
+        key = result_cache.make_key(document.id, document.version, request.query, settings.qa_top_k, request.model_dump(exclude={"url", "query"}))
+        relevant_chunks = await result_cache.get_or_compute(key, answer)
+    else:
+        relevant_chunks = await answer()
 
-    # Retrieve and process chunks individually
-    similarities = []
-    for chunk in crud.get_chunks_individually(db_session, document_id=document.id):
-        chunk_vector = np.array(chunk.vector).flatten()
-        chunk_vector = pad_or_truncate_vector(chunk_vector, target_length)
+    with timed("serialize"):
+        response = QAResponse(relevant_chunks=relevant_chunks)
+        return JSONResponse(content=jsonable_encoder(response), status_code=200)
 
-        similarity = cosine_similarity(query_embedding.reshape(1, -1), chunk_vector.reshape(1, -1))[0][0]
-        similarities.append((chunk.text, similarity))
 
-    # Sort by similarity in descending order
-    similarities.sort(key=lambda x: x[1], reverse=True)
+@router.post("/qa/batch")
+async def question_answer_batch(request: QABatchRequest, db_session: Session = Depends(get_db)) -> StreamingResponse:
+    """Endpoint answering many queries at once, streamed as NDJSON QABatchResult lines as the searches complete.
 
-    # Return the top 5 most relevant chunks
-    relevant_chunks = [text for text, _ in similarities[:5]]
-    response = QAResponse(relevant_chunks=relevant_chunks)
-    return JSONResponse(content=jsonable_encoder(response), status_code=200)
+    Documents are looked up in one query and all queries are embedded in one model call, then searched
+    `batch_search_concurrency` at a time. Each line carries the status code /qa/ would have answered.
+    """
+    with timed("document_lookup"):
+        documents = await run_in_threadpool(crud.get_documents_by_urls, db_session, list({item.url for item in request.items}))
+    targets = {url: (document.id, document.status) for url, document in documents.items()}
+
+    try:
+        with timed("query_embed"):
+            query_embeddings = await inference_executor.run(embedding_service.embed, [item.query for item in request.items])
+    except InferenceQueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending queries, retry later.")
+
+    searches = asyncio.Semaphore(settings.batch_search_concurrency)
+
+    async def answer(index: int, url: str, query: str, query_embedding) -> QABatchResult:
+        document_id, status = targets.get(url, (None, None))
+        if status not in SEARCHABLE_STATUSES:
+            return QABatchResult(index=index, status_code=404, detail=NOT_FOUND)
+        try:
+            async with searches:
+                with timed("search"):
+                    chunks = await retrieve_chunks(request, query, query_embedding, document_id)
+        except Exception as e:
+            logger.error(f"Batch query {index} on document {document_id} failed: {e}")
+            return QABatchResult(index=index, status_code=500, detail="Search failed.")
+        if not chunks and status != DocumentStatusEnum.INDEXED:
+            return QABatchResult(index=index, status_code=404, detail=NOT_FOUND)
+        return QABatchResult(index=index, relevant_chunks=[chunk.text for chunk in chunks])
+
+    async def lines():
+        tasks = [asyncio.create_task(answer(i, item.url, item.query, query_embeddings[i])) for i, item in enumerate(request.items)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                with timed("serialize"):
+                    line = result.model_dump_json() + "\n"
+                yield line
+        finally:
+            # the client went away
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/search/", response_model=SearchResponse)
+async def search(request: SearchRequest, db_session: Session = Depends(get_db)) -> JSONResponse:
+    """Endpoint for searching chunks across a set of documents, a tag or the whole corpus, by vector or hybrid retrieval."""
+
+    try:
+        with timed("query_embed"):
+            query_embedding = await embedding_batcher.embed(request.query)
+    except InferenceQueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending queries, retry later.")
+
+    with timed("search"):
+        if request.mode == RetrievalModeEnum.HYBRID:
+            rows = await hybrid_search(
+                request.query,
+                query_embedding,
+                k=request.k,
+                candidate_depth=request.candidate_depth,
+                vector_weight=request.vector_weight,
+                lexical_weight=request.lexical_weight,
+                document_ids=request.document_ids,
+                tag=request.tag,
+                score_threshold=request.score_threshold,
+            )
+        else:
+            rows = await run_in_threadpool(
+                crud.search_corpus,
+                db_session,
+                query_vector=query_embedding,
+                k=request.k,
+                document_ids=request.document_ids,
+                tag=request.tag,
+                score_threshold=request.score_threshold,
+            )
+    with timed("serialize"):
+        hits = [SearchHit(chunk_id=row.id, document_id=row.document_id, page_start=row.page_start, page_end=row.page_end, score=row.score, text=row.text) for row in rows]
+        return JSONResponse(content=jsonable_encoder(SearchResponse(hits=hits)), status_code=200)
+
+
+@router.get("/stats/embedding-cache")
+async def embedding_cache_stats() -> JSONResponse:
+    """Hit/miss counters of the embedding cache of this API process."""
+    return JSONResponse(content=embedding_cache.stats(), status_code=200)
+
+
+@router.get("/stats/qa-cache")
+async def qa_cache_stats() -> JSONResponse:
+    """Hit/miss counters of the /qa/ result cache of this API process, `shared` counts requests that waited for a concurrent miss."""
+    return JSONResponse(content=result_cache.stats(), status_code=200)
+
+
+@router.get("/stats/embedding-batcher")
+async def embedding_batcher_stats() -> JSONResponse:
+    """Batch size histogram and queue depth of the query embedding batcher."""
+    return JSONResponse(content=embedding_batcher.stats(), status_code=200)
+
+
+@router.get("/stats/memory-index")
+async def memory_index_stats() -> JSONResponse:
+    """Mapped documents, bytes and hit/miss counters of the in-memory index of this API process."""
+    return JSONResponse(content=memory_index.stats(), status_code=200)
@@ -1,4 +1,5 @@
 """Database module."""
+
 import logging
 
 from sqlalchemy import create_engine, MetaData, text
@@ -17,6 +18,7 @@ DBSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
 def check_and_create_pgvector_extension():
+    """Create the pgvector extension if missing, called from init_db (not at import time)."""
     with DBSession() as session:
         # pgvector existence check
         result = session.execute(text("SELECT EXISTS(SELECT * FROM pg_extension WHERE extname = 'vector');"))
@@ -29,9 +31,3 @@ def check_and_create_pgvector_extension():
             logger.info("pgvector extension has been created.")
         else:
             logger.warning("pgvector extension already exists.")
-
-
-try:
-    check_and_create_pgvector_extension()
-except Exception as e:
-    logger.warning(f"unable to create pgvector extension! {e}")
@@ -1,28 +1,152 @@
+import io
 import logging
 import os
+import struct
+from typing import Optional, Sequence
 
-from app.database.models import Document, ChunkEmbedding
+import numpy as np
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.orm import undefer
+
+from app.database.models import Document, ChunkEmbedding, ChunkStaging
 from app.models.document import DocumentStatusEnum
 
-from app.database import Base, DBSession, engine
+from app.database import Base, DBSession, engine, check_and_create_pgvector_extension
 from app.settings import settings
 
 logger = logging.getLogger(__name__)
 
 
+VECTOR_INDEX_NAME = "ix_chunk_embeddings_vector"
+# what the ANN index stores: the float32 vectors, or a compact expression of them (pgvector >= 0.7)
+INDEX_PRECISIONS = ("vector", "halfvec", "bit")
+
+# postgres binary COPY framing: signature, flags, header extension length / end-of-data marker
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+PGCOPY_TRAILER = struct.pack(">h", -1)
+
+
 def init_db() -> None:
     """Initalize db."""
+    try:
+        check_and_create_pgvector_extension()
+    except Exception as e:
+        logger.warning(f"unable to create pgvector extension! {e}")
     Base.metadata.create_all(bind=engine)
+    create_chunk_partitions()
+    create_vector_index()
+
+
+def get_chunk_partitions(connection) -> Optional[int]:
+    """Return the number of partitions of chunk_embeddings, or None if it is a plain (pre-partitioning) table."""
+    relkind = connection.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('chunk_embeddings')")).scalar()
+    if relkind != "p":
+        return None
+    return connection.execute(text("SELECT count(*) FROM pg_inherits WHERE inhparent = CAST('chunk_embeddings' AS regclass)")).scalar()
+
+
+def create_chunk_partitions() -> None:
+    """Create the `chunk_partitions` hash partitions of chunk_embeddings, a partitioned table without them rejects inserts.
+
+    A plain table of an older version or another partition count is left alone, bin/migrate rebuilds it.
+    """
+    modulus = int(settings.chunk_partitions)
+    with engine.begin() as connection:
+        partitions = get_chunk_partitions(connection)
+        if partitions is None or partitions not in (0, modulus):
+            logger.warning(f"chunk_embeddings has {partitions} partitions instead of {modulus}, run bin/migrate")
+            return
+        for remainder in range(modulus):
+            connection.execute(
+                text(f"CREATE TABLE IF NOT EXISTS chunk_embeddings_p{remainder} PARTITION OF chunk_embeddings " f"FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})")
+            )
+
+
+def vector_index_name(precision: Optional[str] = None) -> str:
+    precision = precision or settings.vector_index_precision
+    return VECTOR_INDEX_NAME if precision == "vector" else f"{VECTOR_INDEX_NAME}_{precision}"
+
+
+def vector_index_expression(precision: str) -> tuple:
+    """Return the indexed expression of the vector column and its operator class for a precision."""
+    dim = int(settings.embedding_dim)
+    if precision == "vector":
+        return "vector", "vector_cosine_ops"
+    if precision == "halfvec":
+        return f"(vector::halfvec({dim}))", "halfvec_cosine_ops"
+    if precision == "bit":
+        return f"(binary_quantize(vector)::bit({dim}))", "bit_hamming_ops"
+    raise ValueError(f"Unknown vector index precision: {precision}, expected one of {INDEX_PRECISIONS}")
+
 
+def coarse_distance(query_vector):
+    """Distance of the compact index expression to a query vector, the ORDER BY of the coarse stage of `search_corpus`."""
+    dim = int(settings.embedding_dim)
+    literal = "[" + ",".join(str(value) for value in np.asarray(query_vector, dtype=np.float32).tolist()) + "]"
+    if settings.vector_index_precision == "halfvec":
+        expression = f"(chunk_embeddings.vector::halfvec({dim})) <=> CAST(:query_vector AS halfvec({dim}))"
+    else:
+        expression = f"(binary_quantize(chunk_embeddings.vector)::bit({dim})) <~> binary_quantize(CAST(:query_vector AS vector({dim})))"
+    return text(expression).bindparams(query_vector=literal)
 
-def insert_document(db: DBSession, file_path: str) -> int:
-    document = Document(file_path=file_path, status=DocumentStatusEnum.ADDED)
+
+def create_vector_index() -> None:
+    """Create the ANN index used by `search_chunks` (HNSW or IVFFlat) on the expression of `vector_index_precision`.
+
+    An index of another precision is left in place, drop it once the new one is built.
+    """
+    expression, operator_class = vector_index_expression(settings.vector_index_precision)
+    if settings.vector_index_type == "hnsw":
+        options = f"m = {int(settings.hnsw_m)}, ef_construction = {int(settings.hnsw_ef_construction)}"
+    elif settings.vector_index_type == "ivfflat":
+        options = f"lists = {int(settings.ivfflat_lists)}"
+    else:
+        raise ValueError(f"Unknown vector index type: {settings.vector_index_type}")
+
+    with engine.begin() as connection:
+        connection.execute(
+            text(f"CREATE INDEX IF NOT EXISTS {vector_index_name()} ON chunk_embeddings " f"USING {settings.vector_index_type} ({expression} {operator_class}) WITH ({options})")
+        )
+
+
+def insert_document(db: DBSession, file_path: Optional[str] = None, tags: Optional[Sequence[str]] = None, url: Optional[str] = None, file_hash: Optional[str] = None) -> int:
+    document = Document(file_path=file_path, url=url, file_hash=file_hash, status=DocumentStatusEnum.ADDED, tags=list(tags or []))
     db.add(document)
     db.commit()
     db.refresh(document)
     return document.id
 
 
+def insert_documents(db: DBSession, urls: Sequence[str], tags: Optional[Sequence[str]] = None) -> dict:
+    """Insert one document per url with a single INSERT, returns {url: document id}."""
+    if not urls:
+        return {}
+    rows = [{"url": url, "status": DocumentStatusEnum.ADDED, "tags": list(tags or [])} for url in urls]
+    result = db.execute(insert(Document).values(rows).returning(Document.id, Document.url))
+    ids = {row.url: row.id for row in result}
+    db.commit()
+    return ids
+
+
+def update_document_file(db: DBSession, document_id: int, file_path: str, file_hash: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+    """Point a document at a new version of its PDF, the chunks are replaced when it is re-indexed."""
+    document = db.query(Document).filter_by(id=document_id).first()
+    if document:
+        document.file_path = file_path
+        document.file_hash = file_hash
+        document.etag = etag
+        document.last_modified = last_modified
+        db.commit()
+
+
+def get_indexed_document_by_file_hash(db: DBSession, file_hash: str, exclude_document_id: Optional[int] = None) -> Optional[Document]:
+    """Return an indexed document with identical PDF content, if any."""
+    query = db.query(Document).filter_by(file_hash=file_hash, status=DocumentStatusEnum.INDEXED)
+    if exclude_document_id is not None:
+        query = query.filter(Document.id != exclude_document_id)
+    return query.order_by(Document.id).first()
+
+
 def update_document_status(db: DBSession, document_id: int, status: DocumentStatusEnum) -> None:
     document = db.query(Document).filter_by(id=document_id).first()
     if document:
@@ -30,14 +154,26 @@ def update_document_status(db: DBSession, document_id: int, status: DocumentStat
         db.commit()
 
 
+def ping(db: DBSession) -> bool:
+    """Round trip to the database, used by the readiness check."""
+    return db.execute(text("SELECT 1")).scalar() == 1
+
+
 def get_document(db: DBSession, document_id: int) -> Document:
     return db.query(Document).filter_by(id=document_id).first()
 
 
+def bump_document_version(db: DBSession, document_id: int) -> None:
+    """Increment the version of a document in the current transaction, cached /qa/ results of older versions are never read again."""
+    db.query(Document).filter_by(id=document_id).update({Document.version: Document.version + 1}, synchronize_session=False)
+
+
 def delete_document(db: DBSession, document_id: int) -> None:
-    document = db.query(Document).filter_by(id=document_id).first()
-    if document:
-        db.delete(document)
+    """Delete a document, its chunks first in bounded batches, whatever is left goes with ON DELETE CASCADE."""
+    if db.query(Document.id).filter_by(id=document_id).first():
+        delete_chunks_by_document_id(db, document_id)
+        db.query(ChunkStaging).filter_by(document_id=document_id).delete()
+        db.query(Document).filter_by(id=document_id).delete()
         db.commit()
 
 
@@ -54,23 +190,408 @@ def insert_chunk(db: DBSession, document_id: int, chunk: str, vector) -> int:
         raise
 
 
+def _encode_copy_field(value) -> bytes:
+    """Encode one field in postgres binary COPY format (int4, text, vector or NULL)."""
+    if value is None:
+        return struct.pack(">i", -1)
+    if isinstance(value, str):
+        data = value.replace("\x00", "").encode("utf-8")  # text columns cannot hold NUL bytes
+    elif isinstance(value, (int, np.integer)):
+        data = struct.pack(">i", value)
+    else:
+        vector = np.asarray(value, dtype=">f4")
+        data = struct.pack(">HH", vector.shape[0], 0) + vector.tobytes()
+    return struct.pack(">i", len(data)) + data
+
+
+def copy_rows(db: DBSession, table: str, columns: Sequence[str], rows, batch_size: Optional[int] = None) -> int:
+    """Stream rows into a table with binary `COPY FROM STDIN`, batch_size rows per COPY.
+
+    Runs inside the session transaction and does not commit.
+    """
+    batch_size = batch_size or settings.chunk_insert_batch_size
+    cursor = db.connection().connection.cursor()
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)"
+    field_count = struct.pack(">h", len(columns))
+
+    count, buffer = 0, io.BytesIO()
+    buffer.write(PGCOPY_HEADER)
+    for row in rows:
+        buffer.write(field_count)
+        for value in row:
+            buffer.write(_encode_copy_field(value))
+        count += 1
+        if count % batch_size == 0:
+            buffer.write(PGCOPY_TRAILER)
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            buffer = io.BytesIO()
+            buffer.write(PGCOPY_HEADER)
+    if count % batch_size:
+        buffer.write(PGCOPY_TRAILER)
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+    return count
+
+
+def bulk_insert_chunks(
+    db: DBSession,
+    document_id: int,
+    texts: Sequence[str],
+    vectors,
+    pages: Optional[Sequence[tuple]] = None,
+    text_hashes: Optional[Sequence[Optional[str]]] = None,
+    batch_size: Optional[int] = None,
+    embedding_namespace: Optional[str] = None,
+) -> int:
+    """Insert all chunks of a document in the current transaction (does not commit).
+
+    Args:
+        pages: optional (page_start, page_end) per chunk.
+        text_hashes: optional text hash per chunk, used to reuse the vector of identical chunks.
+        embedding_namespace: `EmbeddingService.vector_namespace` of the vectors, required for their reuse.
+    """
+    pages = pages if pages is not None else [(None, None)] * len(texts)
+    text_hashes = text_hashes if text_hashes is not None else [None] * len(texts)
+    rows = (
+        (document_id, chunk, chunk_hash, embedding_namespace, vector, page_start, page_end)
+        for chunk, chunk_hash, vector, (page_start, page_end) in zip(texts, text_hashes, vectors, pages)
+    )
+    columns = ("document_id", "text", "text_hash", "embedding_namespace", "vector", "page_start", "page_end")
+    return copy_rows(db, "chunk_embeddings", columns, rows, batch_size=batch_size)
+
+
+def replace_chunks(
+    db: DBSession,
+    document_id: int,
+    texts: Sequence[str],
+    vectors,
+    pages: Optional[Sequence[tuple]] = None,
+    text_hashes: Optional[Sequence[Optional[str]]] = None,
+    batch_size: Optional[int] = None,
+    embedding_namespace: Optional[str] = None,
+) -> int:
+    """Atomically swap all chunks of a document: either every new chunk is stored or nothing changes."""
+    try:
+        db.query(ChunkEmbedding).filter_by(document_id=document_id).delete()
+        count = bulk_insert_chunks(db, document_id, texts, vectors, pages=pages, text_hashes=text_hashes, batch_size=batch_size, embedding_namespace=embedding_namespace)
+        bump_document_version(db, document_id)
+        db.commit()
+        return count
+    except Exception as e:
+        logger.error(f"Failed to insert chunks of document {document_id}: {e}")
+        db.rollback()
+        raise
+
+
+def copy_chunks(db: DBSession, source_document_id: int, document_id: int) -> int:
+    """Replace the chunks of a document with copies of the chunks of an identical document, in one statement."""
+    try:
+        db.query(ChunkEmbedding).filter_by(document_id=document_id).delete()
+        count = db.execute(
+            text(
+                "INSERT INTO chunk_embeddings (document_id, text, text_hash, embedding_namespace, vector, page_start, page_end) "
+                "SELECT :document_id, text, text_hash, embedding_namespace, vector, page_start, page_end FROM chunk_embeddings "
+                "WHERE document_id = :source_document_id ORDER BY id"
+            ),
+            {"document_id": document_id, "source_document_id": source_document_id},
+        ).rowcount
+        bump_document_version(db, document_id)
+        db.commit()
+        return count
+    except Exception as e:
+        logger.error(f"Failed to copy chunks of document {source_document_id} to document {document_id}: {e}")
+        db.rollback()
+        raise
+
+
+def get_vectors_by_text_hash(db: DBSession, text_hashes: Sequence[str], embedding_namespace: str) -> dict:
+    """Return {text_hash: vector} of already embedded chunks with these hashes, from any document.
+
+    Only vectors of `embedding_namespace` are returned, vectors of another model, pooling or backend
+    (or stored before namespaces, NULL) are in another vector space.
+    """
+    rows = (
+        db.query(ChunkEmbedding.text_hash, ChunkEmbedding.vector)
+        .filter(ChunkEmbedding.text_hash.in_(set(text_hashes)), ChunkEmbedding.embedding_namespace == embedding_namespace)
+        .distinct(ChunkEmbedding.text_hash)
+    )
+    return {row.text_hash: np.asarray(row.vector, dtype=np.float32) for row in rows}
+
+
+def replace_staged_chunks(
+    db: DBSession,
+    document_id: int,
+    shard: int,
+    texts: Sequence[str],
+    vectors,
+    pages: Sequence[tuple],
+    text_hashes: Sequence[str],
+    embedding_namespace: Optional[str] = None,
+) -> int:
+    """Stage the chunks of one page-range shard, replacing what a previous attempt of the shard staged.
+
+    Nothing is staged once the document left the LOAD status, checked under a share lock of the document
+    row: a shard finishing after its extraction failed can not add rows behind `fail_document`.
+
+    Args:
+        vectors: one vector per chunk, or None to leave them to the embedding stage.
+        embedding_namespace: `EmbeddingService.vector_namespace` of the vectors.
+
+    Returns:
+        int: number of staged chunks.
+    """
+    vectors = vectors if vectors is not None else [None] * len(texts)
+    try:
+        status = db.query(Document.status).filter_by(id=document_id).with_for_update(read=True).scalar()
+        if status != DocumentStatusEnum.LOAD:
+            db.rollback()
+            logger.info(f"Not staging shard {shard} of document {document_id}, its status is {status}")
+            return 0
+        db.query(ChunkStaging).filter_by(document_id=document_id, shard=shard).delete()
+        rows = (
+            (document_id, shard, chunk, chunk_hash, embedding_namespace, vector, page_start, page_end)
+            for chunk, chunk_hash, vector, (page_start, page_end) in zip(texts, text_hashes, vectors, pages)
+        )
+        columns = ("document_id", "shard", "text", "text_hash", "embedding_namespace", "vector", "page_start", "page_end")
+        count = copy_rows(db, "chunk_staging", columns, rows)
+        db.commit()
+        return count
+    except Exception as e:
+        logger.error(f"Failed to stage chunks of document {document_id}, shard {shard}: {e}")
+        db.rollback()
+        raise
+
+
+def delete_staged_chunks(db: DBSession, document_id: int) -> None:
+    db.query(ChunkStaging).filter_by(document_id=document_id).delete()
+    db.commit()
+
+
+def has_staged_chunks(db: DBSession, document_id: int) -> bool:
+    return db.query(ChunkStaging.id).filter_by(document_id=document_id).first() is not None
+
+
+def fail_document(db: DBSession, document_id: int, delete_staged: bool = False) -> None:
+    """Mark a document FAILED, dropping its staged chunks in the same transaction with `delete_staged`.
+
+    Failed extractions drop them, so the staged chunks of a FAILED document are always a complete
+    extraction whose embedding stage failed, and can be embedded again without extracting.
+    """
+    db.query(Document).filter_by(id=document_id).update({Document.status: DocumentStatusEnum.FAILED}, synchronize_session=False)
+    if delete_staged:
+        db.query(ChunkStaging).filter_by(document_id=document_id).delete()
+    db.commit()
+
+
+def get_unembedded_staged_chunks(db: DBSession, document_id: int, limit: int):
+    """Return up to limit staged chunks (`id`, `text`) of a document that have no vector yet."""
+    return db.query(ChunkStaging.id, ChunkStaging.text).filter(ChunkStaging.document_id == document_id, ChunkStaging.vector.is_(None)).order_by(ChunkStaging.id).limit(limit).all()
+
+
+def set_staged_vectors(db: DBSession, chunk_ids: Sequence[int], vectors, embedding_namespace: str) -> None:
+    db.bulk_update_mappings(ChunkStaging, [{"id": chunk_id, "vector": vector, "embedding_namespace": embedding_namespace} for chunk_id, vector in zip(chunk_ids, vectors)])
+    db.commit()
+
+
+def promote_staged_chunks(db: DBSession, document_id: int) -> int:
+    """Atomically replace the chunks of a document with its staged chunks, in page order."""
+    try:
+        db.query(ChunkEmbedding).filter_by(document_id=document_id).delete()
+        count = db.execute(
+            text(
+                "INSERT INTO chunk_embeddings (document_id, text, text_hash, embedding_namespace, vector, page_start, page_end) "
+                "SELECT document_id, text, text_hash, embedding_namespace, vector, page_start, page_end FROM chunk_staging "
+                "WHERE document_id = :document_id ORDER BY shard, id"
+            ),
+            {"document_id": document_id},
+        ).rowcount
+        db.query(ChunkStaging).filter_by(document_id=document_id).delete()
+        bump_document_version(db, document_id)
+        db.commit()
+        return count
+    except Exception as e:
+        logger.error(f"Failed to promote staged chunks of document {document_id}: {e}")
+        db.rollback()
+        raise
+
+
 def get_chunks(db: DBSession, document_id: int):
     return db.query(ChunkEmbedding).filter_by(document_id=document_id).all()
 
 
 def get_chunks_individually(db: DBSession, document_id: int):
-    """Generator to yield chunks one by one for a given document."""
-    chunks = db.query(ChunkEmbedding).filter_by(document_id=document_id)
+    """Generator to yield chunks one by one for a given document, with their vectors."""
+    chunks = db.query(ChunkEmbedding).options(undefer(ChunkEmbedding.vector)).filter_by(document_id=document_id)
     for chunk in chunks:
         yield chunk
 
 
-def delete_chunks_by_document_id(db: DBSession, document_id: int) -> None:
-    db.query(ChunkEmbedding).filter_by(document_id=document_id).delete()
-    db.commit()
+def get_chunk_vectors(db: DBSession, document_id: int) -> tuple:
+    """Return the chunk ids (int64) and vectors (float32 matrix) of a document, ordered by id."""
+    rows = db.query(ChunkEmbedding.id, ChunkEmbedding.vector).filter_by(document_id=document_id).order_by(ChunkEmbedding.id).all()
+    ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+    vectors = np.stack([np.asarray(row.vector, dtype=np.float32) for row in rows]) if rows else np.empty((0, settings.embedding_dim), dtype=np.float32)
+    return ids, vectors
+
+
+def get_chunks_by_ids(db: DBSession, chunk_ids: Sequence[int], with_vectors: bool = False) -> dict:
+    """Return `id`, `document_id`, `page_start`, `page_end` and `text` rows keyed by chunk id, and `vector` with `with_vectors`."""
+    columns = [ChunkEmbedding.id, ChunkEmbedding.document_id, ChunkEmbedding.page_start, ChunkEmbedding.page_end, ChunkEmbedding.text]
+    if with_vectors:
+        columns.append(ChunkEmbedding.vector)
+    rows = db.query(*columns).filter(ChunkEmbedding.id.in_([int(chunk_id) for chunk_id in chunk_ids]))
+    return {row.id: row for row in rows}
+
+
+def set_vector_search_params(db: DBSession, limit: int = 0) -> None:
+    """Apply the ANN recall/speed knobs to the current transaction, an HNSW scan returns at most ef_search rows."""
+    if settings.vector_index_type == "hnsw":
+        db.execute(text(f"SET LOCAL hnsw.ef_search = {max(int(settings.hnsw_ef_search), int(limit))}"))
+    else:
+        db.execute(text(f"SET LOCAL ivfflat.probes = {int(settings.ivfflat_probes)}"))
+    if settings.vector_iterative_scan:
+        db.execute(text(f"SET LOCAL {settings.vector_index_type}.iterative_scan = {settings.vector_iterative_scan}"))
+
+
+def filter_documents(query, document_ids: Optional[Sequence[int]] = None, tag: Optional[str] = None):
+    """Restrict a chunk query to a set of documents and/or the documents with a tag."""
+    if document_ids is not None:
+        query = query.filter(ChunkEmbedding.document_id.in_(list(document_ids)))
+    if tag is not None:
+        # containment (@>) is served by the ix_documents_tags GIN index, `tag = ANY(tags)` is not
+        query = query.filter(ChunkEmbedding.document_id.in_(select(Document.id).where(Document.tags.contains([tag]))))
+    return query
+
+
+def search_corpus(
+    db: DBSession,
+    query_vector,
+    k: int,
+    document_ids: Optional[Sequence[int]] = None,
+    tag: Optional[str] = None,
+    score_threshold: Optional[float] = None,
+):
+    """Return the k chunks closest to the query vector, across the corpus or a subset of it.
+
+    One ANN query over chunk_embeddings: document ids and tags only filter the index scan, so the
+    cost does not grow with the number of documents searched. The score threshold is applied to
+    the top k afterwards, a distance predicate in SQL would make the index scan walk the whole graph
+    when few rows pass it.
+
+    With a compact `vector_index_precision` the search has two stages: the index returns the
+    `vector_rescore_depth` closest candidates by halfvec cosine or bit Hamming distance, and those
+    are ranked by the exact cosine distance of their float32 vectors.
+
+    Args:
+        db: database session.
+        query_vector: normalized query embedding.
+        k: number of chunks.
+        document_ids: restrict to these documents.
+        tag: restrict to documents with this tag.
+        score_threshold: drop chunks with a lower cosine similarity.
+
+    Returns:
+        list: rows with `id`, `document_id`, `page_start`, `page_end`, `text` and `score`, best first.
+    """
+    distance = ChunkEmbedding.vector.cosine_distance(query_vector)
+    query = db.query(
+        ChunkEmbedding.id,
+        ChunkEmbedding.document_id,
+        ChunkEmbedding.page_start,
+        ChunkEmbedding.page_end,
+        ChunkEmbedding.text,
+        (1 - distance).label("score"),
+    )
+    if settings.vector_index_precision == "vector":
+        set_vector_search_params(db, k)
+        query = filter_documents(query, document_ids=document_ids, tag=tag)
+    else:
+        depth = max(k, settings.vector_rescore_depth)
+        set_vector_search_params(db, depth)
+        candidates = filter_documents(select(ChunkEmbedding.id), document_ids=document_ids, tag=tag)
+        query = query.filter(ChunkEmbedding.id.in_(candidates.order_by(coarse_distance(query_vector)).limit(depth)))
+
+    rows = query.order_by(distance).limit(k).all()
+    # relaxed iterative scans may return rows slightly out of order
+    rows.sort(key=lambda row: row.score, reverse=True)
+    if score_threshold is not None:
+        rows = [row for row in rows if row.score >= score_threshold]
+    return rows
+
+
+def search_text(db: DBSession, query_text: str, k: int, document_ids: Optional[Sequence[int]] = None, tag: Optional[str] = None):
+    """Return the k chunks ranking best for a full-text query, across the corpus or a subset of it.
+
+    The query is parsed with `websearch_to_tsquery` (quoted phrases, OR, -word) and matched on the GIN
+    indexed `text_search` column, matches are ranked with `ts_rank` normalized by document length.
+
+    Returns:
+        list: rows with `id`, `document_id`, `page_start`, `page_end`, `text` and `score` (the rank), best first.
+    """
+    ts_query = func.websearch_to_tsquery(settings.text_search_config, query_text)
+    rank = func.ts_rank(ChunkEmbedding.text_search, ts_query, 1)
+    query = db.query(
+        ChunkEmbedding.id,
+        ChunkEmbedding.document_id,
+        ChunkEmbedding.page_start,
+        ChunkEmbedding.page_end,
+        ChunkEmbedding.text,
+        rank.label("score"),
+    ).filter(ChunkEmbedding.text_search.op("@@")(ts_query))
+    query = filter_documents(query, document_ids=document_ids, tag=tag)
+    return query.order_by(rank.desc(), ChunkEmbedding.id).limit(k).all()
+
+
+def search_chunks(db: DBSession, document_id: int, query_vector, k: int):
+    """Return the k chunks of a document closest to the query vector.
+
+    Ordering happens in postgres on the pgvector cosine distance operator (`<=>`), so only
+    k rows cross the wire. Each row has `id`, `text` and `score` (cosine similarity).
+    """
+    return search_corpus(db, query_vector, k, document_ids=[document_id])
+
+
+def delete_chunks_by_document_id(db: DBSession, document_id: int, batch_size: Optional[int] = None) -> int:
+    """Delete the chunks of a document, `chunk_delete_batch_size` rows per transaction.
+
+    Short transactions keep locks, WAL bursts and replication lag bounded and let autovacuum
+    reclaim the rows as it goes; the document_id filter confines every batch to one partition.
+
+    Returns:
+        int: number of chunks deleted.
+    """
+    batch_size = int(batch_size or settings.chunk_delete_batch_size)
+    deleted = 0
+    while True:
+        count = db.execute(
+            text("DELETE FROM chunk_embeddings WHERE document_id = :document_id AND id IN " "(SELECT id FROM chunk_embeddings WHERE document_id = :document_id LIMIT :batch_size)"),
+            {"document_id": document_id, "batch_size": batch_size},
+        ).rowcount
+        db.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def get_documents_by_urls(db: DBSession, urls: Sequence[str]) -> dict:
+    """Return {url: document} of the urls with a document, the latest one per url, in one query."""
+    documents = {}
+    for document in db.query(Document).filter(Document.url.in_(list(urls))).order_by(Document.id):
+        documents[document.url] = document
+
+    # documents uploaded before urls were stored are found by the file name of the url
+    legacy_paths = {os.path.join(settings.pdfs_data_dir, os.path.basename(url)): url for url in urls if url not in documents}
+    if legacy_paths:
+        for document in db.query(Document).filter(Document.url.is_(None), Document.file_path.in_(list(legacy_paths))).order_by(Document.id.desc()):
+            documents.setdefault(legacy_paths[document.file_path], document)
+    return documents
 
 
 def get_document_by_url(db: DBSession, url: str) -> Document:
-    file_name = os.path.basename(url)
-    file_path = os.path.join(settings.pdfs_data_dir, file_name)
-    return db.query(Document).filter_by(file_path=file_path).first()
+    document = db.query(Document).filter_by(url=url).order_by(Document.id.desc()).first()
+    if document is None:
+        # documents uploaded before urls were stored are found by the file name of the url
+        file_path = os.path.join(settings.pdfs_data_dir, os.path.basename(url))
+        document = db.query(Document).filter_by(url=None, file_path=file_path).first()
+    return document
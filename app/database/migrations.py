@@ -0,0 +1,217 @@
+"""Schema migrations and backfills for databases created by older versions.
+
+Run with `bin/migrate` (or `python3 -m app.database.migrations`). Every step is idempotent.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+
+from sqlalchemy import text
+
+from app.database import Base, crud
+from app.database.models import ChunkEmbedding, Document
+from app.database.session import db_context
+from app.huggingface.cache import text_hash
+from app.huggingface.embedding import EmbeddingService
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# idempotent DDL, applied in order before the vector backfill, whose ORM inserts write every mapped column
+SCHEMA_STATEMENTS = [
+    "ALTER TABLE chunk_embeddings ADD COLUMN IF NOT EXISTS page_start integer, ADD COLUMN IF NOT EXISTS page_end integer",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS tags varchar[] NOT NULL DEFAULT '{}'",
+    "CREATE INDEX IF NOT EXISTS ix_documents_tags ON documents USING gin (tags)",
+    f"ALTER TABLE chunk_embeddings ADD COLUMN IF NOT EXISTS text_search tsvector GENERATED ALWAYS AS (to_tsvector('{settings.text_search_config}', text)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_chunk_embeddings_text_search ON chunk_embeddings USING gin (text_search)",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS url varchar, ADD COLUMN IF NOT EXISTS file_hash varchar(64)",
+    "CREATE INDEX IF NOT EXISTS ix_documents_url ON documents (url)",
+    "CREATE INDEX IF NOT EXISTS ix_documents_file_hash ON documents (file_hash)",
+    "ALTER TABLE chunk_embeddings ADD COLUMN IF NOT EXISTS text_hash varchar(64)",
+    "CREATE INDEX IF NOT EXISTS ix_chunk_embeddings_text_hash ON chunk_embeddings (text_hash)",
+    f"CREATE TABLE IF NOT EXISTS chunk_staging (id serial PRIMARY KEY, document_id integer NOT NULL REFERENCES documents (id), shard integer NOT NULL, "
+    f"text text NOT NULL, text_hash varchar(64), vector vector({settings.embedding_dim}), page_start integer, page_end integer)",
+    "ALTER TABLE chunk_staging ALTER COLUMN vector DROP NOT NULL",
+    "CREATE INDEX IF NOT EXISTS ix_chunk_staging_document_id ON chunk_staging (document_id)",
+    "ALTER TABLE documents ALTER COLUMN file_path DROP NOT NULL",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS etag varchar, ADD COLUMN IF NOT EXISTS last_modified varchar",
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 0",
+    "ALTER TABLE chunk_embeddings ADD COLUMN IF NOT EXISTS embedding_namespace varchar",
+    "ALTER TABLE chunk_staging ADD COLUMN IF NOT EXISTS embedding_namespace varchar",
+    "ALTER TABLE chunk_staging DROP CONSTRAINT IF EXISTS chunk_staging_document_id_fkey, "
+    "ADD CONSTRAINT chunk_staging_document_id_fkey FOREIGN KEY (document_id) REFERENCES documents (id) ON DELETE CASCADE",
+]
+
+# chunk_embeddings is renamed to this while its rows move to the partitioned table
+LEGACY_CHUNK_TABLE = "chunk_embeddings_unpartitioned"
+CHUNK_COLUMNS = "id, document_id, text, text_hash, embedding_namespace, vector, page_start, page_end"
+
+
+def get_column_type(db, table: str, column: str) -> str:
+    """Return the formatted postgres type of a column, e.g. `vector(1024)`."""
+    return db.execute(
+        text("SELECT format_type(atttypid, atttypmod) FROM pg_attribute WHERE attrelid = CAST(:table AS regclass) AND attname = :column"),
+        {"table": table, "column": column},
+    ).scalar()
+
+
+def backfill_fixed_dim_vectors(db, reembed_all: bool = False) -> int:
+    """Re-embed chunks stored as flattened token-matrix slices into one pooled vector per chunk.
+
+    Legacy rows split one chunk into several rows sharing the same text, so rows are grouped by
+    (document_id, text), embedded once and rewritten as a single row, one transaction per document.
+
+    Args:
+        db: database session.
+        reembed_all: also re-embed documents that already have `embedding_dim` wide vectors,
+            e.g. after changing the pooling mode.
+
+    Returns:
+        int: number of documents backfilled.
+    """
+    condition = "" if reembed_all else "WHERE vector_dims(vector) <> :dim"
+    document_ids = (
+        db.execute(
+            text(f"SELECT DISTINCT document_id FROM chunk_embeddings {condition} ORDER BY document_id"),
+            {"dim": settings.embedding_dim},
+        )
+        .scalars()
+        .all()
+    )
+
+    embedding_service = EmbeddingService()
+    for document_id in document_ids:
+        texts = (
+            db.execute(
+                text("SELECT text FROM chunk_embeddings WHERE document_id = :document_id GROUP BY text ORDER BY min(id)"),
+                {"document_id": document_id},
+            )
+            .scalars()
+            .all()
+        )
+        vectors = embedding_service.embed(texts)
+        try:
+            db.query(ChunkEmbedding).filter_by(document_id=document_id).delete()
+            db.add_all(
+                ChunkEmbedding(document_id=document_id, text=chunk, embedding_namespace=embedding_service.vector_namespace, vector=vector.tolist())
+                for chunk, vector in zip(texts, vectors)
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        logger.info(f"Backfilled document {document_id}: {len(texts)} chunks")
+
+    return len(document_ids)
+
+
+def backfill_content_hashes(db, batch_size: int = 1000) -> tuple:
+    """Hash the PDFs of documents and the texts of chunks stored before content hashing.
+
+    Returns:
+        tuple: number of documents and chunks hashed.
+    """
+    documents = 0
+    for document in db.query(Document).filter(Document.file_hash.is_(None)).all():
+        if document.file_path and os.path.isfile(document.file_path):
+            digest = hashlib.sha256()
+            with open(document.file_path, "rb") as f:
+                for data in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(data)
+            document.file_hash = digest.hexdigest()
+            documents += 1
+    db.commit()
+
+    chunks = 0
+    while True:
+        rows = db.query(ChunkEmbedding.id, ChunkEmbedding.document_id, ChunkEmbedding.text).filter(ChunkEmbedding.text_hash.is_(None)).limit(batch_size).all()
+        if not rows:
+            break
+        db.bulk_update_mappings(ChunkEmbedding, [{"id": row.id, "document_id": row.document_id, "text_hash": text_hash(row.text)} for row in rows])
+        db.commit()
+        chunks += len(rows)
+    return documents, chunks
+
+
+def partition_chunk_embeddings(db) -> int:
+    """Rebuild chunk_embeddings as a table hash partitioned by document_id, in one transaction.
+
+    Applies to the plain table of older versions and to a partitioned table with another number of
+    partitions than `chunk_partitions`. The old table is renamed, its indexes and primary key are
+    dropped (their names would collide), the rows are copied with their ids and the old table is dropped.
+    The ANN index is built afterwards by `crud.create_vector_index`.
+
+    Returns:
+        int: number of chunks moved, 0 if the table already has the configured partitions.
+    """
+    partitions = crud.get_chunk_partitions(db.connection())
+    if partitions in (0, settings.chunk_partitions):
+        return 0
+
+    try:
+        sequence = db.execute(text("SELECT pg_get_serial_sequence('chunk_embeddings', 'id')")).scalar()
+        db.execute(text(f"ALTER TABLE chunk_embeddings RENAME TO {LEGACY_CHUNK_TABLE}"))
+        if sequence:
+            db.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {LEGACY_CHUNK_TABLE}_id_seq"))
+        legacy_partitions = (
+            db.execute(text("SELECT CAST(inhrelid AS regclass) FROM pg_inherits WHERE inhparent = CAST(:table AS regclass)"), {"table": LEGACY_CHUNK_TABLE}).scalars().all()
+        )
+        for i, partition in enumerate(legacy_partitions):
+            db.execute(text(f"ALTER TABLE {partition} RENAME TO {LEGACY_CHUNK_TABLE}_{i}"))
+        db.execute(text(f"ALTER TABLE {LEGACY_CHUNK_TABLE} DROP CONSTRAINT IF EXISTS chunk_embeddings_pkey"))
+        indexes = db.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table"), {"table": LEGACY_CHUNK_TABLE}).scalars().all()
+        for index in indexes:
+            db.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+        Base.metadata.create_all(bind=db.connection(), tables=[ChunkEmbedding.__table__])
+        for remainder in range(settings.chunk_partitions):
+            db.execute(
+                text(
+                    f"CREATE TABLE chunk_embeddings_p{remainder} PARTITION OF chunk_embeddings "
+                    f"FOR VALUES WITH (MODULUS {int(settings.chunk_partitions)}, REMAINDER {remainder})"
+                )
+            )
+        count = db.execute(text(f"INSERT INTO chunk_embeddings ({CHUNK_COLUMNS}) SELECT {CHUNK_COLUMNS} FROM {LEGACY_CHUNK_TABLE}")).rowcount
+        db.execute(text("SELECT setval(pg_get_serial_sequence('chunk_embeddings', 'id'), coalesce(max(id), 0) + 1, false) FROM chunk_embeddings"))
+        db.execute(text(f"DROP TABLE {LEGACY_CHUNK_TABLE}"))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    db.execute(text("ANALYZE chunk_embeddings"))
+    db.commit()
+    return count
+
+
+def migrate(reembed_all: bool = False) -> None:
+    """Bring an existing database up to the current schema."""
+    with db_context() as db:
+        for statement in SCHEMA_STATEMENTS:
+            db.execute(text(statement))
+        db.commit()
+
+        vector_type = f"vector({settings.embedding_dim})"
+        if reembed_all or get_column_type(db, "chunk_embeddings", "vector") != vector_type:
+            count = backfill_fixed_dim_vectors(db, reembed_all=reembed_all)
+            logger.info(f"Backfilled {count} documents to {settings.embedding_pooling} pooled vectors")
+            db.execute(text(f"ALTER TABLE chunk_embeddings ALTER COLUMN vector TYPE {vector_type}"))
+            db.commit()
+
+        count = partition_chunk_embeddings(db)
+        logger.info(f"Moved {count} chunks to {settings.chunk_partitions} partitions")
+
+        documents, chunks = backfill_content_hashes(db)
+        logger.info(f"Hashed {documents} documents and {chunks} chunks")
+
+    crud.create_chunk_partitions()
+    crud.create_vector_index()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reembed-all", action="store_true", help="re-embed every document, not only legacy rows")
+    args = parser.parse_args()
+    migrate(reembed_all=args.reembed_all)
@@ -1,22 +1,63 @@
-from sqlalchemy import Column, Integer, String, Text, Enum, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, Integer, String, Text, Enum, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from pgvector.sqlalchemy import Vector
 from app.models.document import DocumentStatusEnum
 from app.database import Base
+from app.settings import settings
 
 
 class Document(Base):
     __tablename__ = "documents"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    file_path = Column(String, nullable=False)
+    file_path = Column(String, nullable=True)  # set once the extraction stage downloaded the url
+    url = Column(String, nullable=True, index=True)
+    file_hash = Column(String(64), nullable=True, index=True)  # sha256 of the PDF
+    etag = Column(String, nullable=True)  # validators of the last download, for conditional requests
+    last_modified = Column(String, nullable=True)
+    version = Column(Integer, default=0, server_default="0", nullable=False)  # bumped whenever the chunks are replaced
     status = Column(Enum(DocumentStatusEnum), default=DocumentStatusEnum.ADDED, nullable=False)
-    chunks = relationship("ChunkEmbedding", back_populates="document")
+    tags = Column(ARRAY(String), default=list, server_default="{}", nullable=False)
+    # chunk rows go with the document through ON DELETE CASCADE, not one ORM delete per chunk
+    chunks = relationship("ChunkEmbedding", back_populates="document", passive_deletes=True)
+
+    __table_args__ = (Index("ix_documents_tags", "tags", postgresql_using="gin"),)
 
 
 class ChunkEmbedding(Base):
+    """Embedded chunks, hash partitioned by document so the chunks of a document live in one partition.
+
+    Partitions are created by `crud.create_chunk_partitions`, the primary key includes the partition key.
+    """
+
     __tablename__ = "chunk_embeddings"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True, index=True)
     text = Column(Text, nullable=False)
-    vector = Column(Vector(), nullable=False)
+    text_hash = Column(String(64), nullable=True, index=True)  # sha256 of the normalized text
+    embedding_namespace = Column(String, nullable=True)  # model, pooling and backend of the vector, see EmbeddingService
+    vector = deferred(Column(Vector(settings.embedding_dim), nullable=False))  # loaded on access, or with undefer()
+    page_start = Column(Integer, nullable=True)
+    page_end = Column(Integer, nullable=True)
+    text_search = Column(TSVECTOR, Computed(f"to_tsvector('{settings.text_search_config}', text)", persisted=True))
     document = relationship("Document", back_populates="chunks")
+
+    __table_args__ = (
+        Index("ix_chunk_embeddings_text_search", "text_search", postgresql_using="gin"),
+        {"postgresql_partition_by": "HASH (document_id)"},
+    )
+
+
+class ChunkStaging(Base):
+    """Chunks between the extraction and the embedding stage, moved to chunk_embeddings in one transaction once embedded."""
+
+    __tablename__ = "chunk_staging"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    shard = Column(Integer, nullable=False)  # first page of the shard, 0-based
+    text = Column(Text, nullable=False)
+    text_hash = Column(String(64), nullable=True)
+    embedding_namespace = Column(String, nullable=True)
+    vector = Column(Vector(settings.embedding_dim), nullable=True)  # set by the embedding stage
+    page_start = Column(Integer, nullable=True)
+    page_end = Column(Integer, nullable=True)
@@ -0,0 +1,240 @@
+import inspect
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+from typing import Optional
+
+import torch
+from transformers import AutoConfig, AutoModel, AutoTokenizer
+from transformers.modeling_utils import no_init_weights
+from transformers.utils import SAFE_WEIGHTS_NAME, WEIGHTS_NAME, cached_file
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+MODEL_LOAD_MODES = ("mmap", "copy")
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def configure_threads() -> None:
+    """Apply the per-process thread budget `embedding_num_threads` to torch, 0 keeps the torch default (one thread per core)."""
+    if settings.embedding_num_threads <= 0:
+        return
+    torch.set_num_threads(settings.embedding_num_threads)
+    try:
+        torch.set_num_interop_threads(1)  # only allowed before the first parallel operation of the process
+    except RuntimeError:
+        pass
+
+
+def find_checkpoint(model_name: str) -> Optional[str]:
+    """Return the local path of the single-file checkpoint of a model, safetensors first, downloading it if needed."""
+    for filename in (SAFE_WEIGHTS_NAME, WEIGHTS_NAME):
+        path = cached_file(model_name, filename, _raise_exceptions_for_missing_entries=False, _raise_exceptions_for_connection_errors=False)
+        if path:
+            return path
+    return None
+
+
+def mmap_safetensors(path: str) -> dict:
+    """Map a safetensors file copy-on-write and return its tensors as views of the mapping.
+
+    Processes mapping the same file share its pages through the page cache until one of them writes to a tensor.
+    """
+    with open(path, "rb") as f:
+        (header_size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        count = (end - start) // dtype.itemsize
+        if count == 0:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        # the tensors keep a reference to the mapping, it is unmapped with the last of them
+        tensors[name] = torch.frombuffer(buffer, dtype=dtype, count=count, offset=8 + header_size + start).reshape(info["shape"])
+    return tensors
+
+
+def load_mmap_model(model_name: str) -> Optional[torch.nn.Module]:
+    """Build a model whose weights are memory mapped from its checkpoint instead of copied into each process.
+
+    Returns:
+        The model, or None when the checkpoint can not be used as is (sharded, legacy pickle format, missing
+        keys or other dtypes than the model), the caller then falls back to a regular load.
+    """
+    path = find_checkpoint(model_name)
+    if path is None:
+        logger.warning(f"{model_name} has no single-file checkpoint, loading a private copy of the weights")
+        return None
+    try:
+        if path.endswith(".safetensors"):
+            state_dict = mmap_safetensors(path)
+        else:
+            state_dict = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    except (RuntimeError, ValueError, KeyError, pickle.UnpicklingError) as e:
+        logger.warning(f"Unable to memory map {path}, loading a private copy of the weights: {e}")
+        return None
+
+    config = AutoConfig.from_pretrained(model_name)
+    with no_init_weights():
+        model = AutoModel.from_config(config)
+    prefix = f"{model.base_model_prefix}."
+    state_dict = {key[len(prefix) :] if key.startswith(prefix) else key: tensor for key, tensor in state_dict.items()}
+
+    expected = model.state_dict()
+    unusable = [key for key, tensor in expected.items() if key not in state_dict or state_dict[key].dtype != tensor.dtype or state_dict[key].shape != tensor.shape]
+    if unusable:
+        logger.warning(f"{path} does not match {type(model).__name__} ({unusable[:3]}...), loading a private copy of the weights")
+        return None
+    # assign: the parameters become the mapped tensors instead of copies of them
+    model.load_state_dict({key: state_dict[key] for key in expected}, assign=True)
+    return model
+
+
+class EmbeddingBackend:
+    """
+    Interface of an inference backend: a tokenizer and a forward pass returning token states.
+
+    Attributes:
+        - tokenizer: Hugging Face tokenizer of the model.
+        - hidden_size: Width of the token states.
+
+    Methods:
+        - forward(features): Returns the last hidden state (batch, tokens, hidden) for padded tokenizer features.
+    """
+
+    name = ""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.hidden_size = 0
+
+    def forward(self, features: dict) -> torch.Tensor:
+        raise NotImplementedError
+
+
+class TorchBackend(EmbeddingBackend):
+    """Full precision PyTorch model, its weights memory mapped from the checkpoint with `embedding_model_load=mmap`."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        self.model = self.load_model().eval()
+        self.hidden_size = AutoConfig.from_pretrained(model_name).hidden_size
+
+    def load_model(self) -> torch.nn.Module:
+        if settings.embedding_model_load == "mmap":
+            model = load_mmap_model(self.model_name)
+            if model is not None:
+                return model
+        return AutoModel.from_pretrained(self.model_name)
+
+    def forward(self, features: dict) -> torch.Tensor:
+        device = next(self.model.parameters()).device
+        return self.model(**{key: value.to(device) for key, value in features.items()}).last_hidden_state
+
+
+class TorchInt8Backend(TorchBackend):
+    """PyTorch model with dynamic int8 quantization of the Linear layers (CPU only), the quantized weights are private to each process."""
+
+    name = "torch-int8"
+
+    def load_model(self) -> torch.nn.Module:
+        return torch.quantization.quantize_dynamic(super().load_model(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime session with all graph optimizations, exported once into `onnx_cache_dir`."""
+
+    name = "onnx"
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("The onnx embedding backend needs the onnxruntime package.")
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = max(settings.embedding_num_threads, 0)  # 0 lets onnxruntime use every core
+        options.inter_op_num_threads = 1 if settings.embedding_num_threads > 0 else 0
+        self.session = onnxruntime.InferenceSession(self.export(), options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.hidden_size = self.session.get_outputs()[0].shape[-1]
+
+    def export(self) -> str:
+        """Export the model to ONNX unless a previous export exists, returns the model path."""
+        path = os.path.join(settings.onnx_cache_dir, self.model_name.replace("/", "--"), "model.onnx")
+        if os.path.isfile(path):
+            return path
+
+        logger.info(f"Exporting {self.model_name} to {path}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        model = AutoModel.from_pretrained(self.model_name).eval()
+        sample = dict(self.tokenizer(["export sample"], return_tensors="pt"))
+        # graph inputs follow the forward() signature order, not the tokenizer output order
+        input_names = [name for name in inspect.signature(model.forward).parameters if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "tokens"} for name in [*input_names, "last_hidden_state"]}
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            torch.onnx.export(model, (sample,), tmp_path, input_names=input_names, output_names=["last_hidden_state"], dynamic_axes=dynamic_axes, opset_version=17)
+        os.replace(tmp_path, path)  # concurrent exports by several workers all end with a complete file
+        return path
+
+    def forward(self, features: dict) -> torch.Tensor:
+        inputs = {key: value.cpu().numpy() for key, value in features.items() if key in self.input_names}
+        return torch.from_numpy(self.session.run(["last_hidden_state"], inputs)[0])
+
+
+BACKENDS = {backend.name: backend for backend in (TorchBackend, TorchInt8Backend, OnnxBackend)}
+
+
+def load_backend(name: str, model_name: str) -> EmbeddingBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}, expected one of {list(BACKENDS)}")
+    if settings.embedding_model_load not in MODEL_LOAD_MODES:
+        raise ValueError(f"Unknown embedding model load mode: {settings.embedding_model_load}, expected one of {MODEL_LOAD_MODES}")
+    configure_threads()
+    return BACKENDS[name](model_name)
+
+
+def prefetch_model(name: str, model_name: str) -> None:
+    """Download the files of a model before starting worker processes, so they do not all download them at once.
+
+    Memory mapped checkpoints are read once to warm the page cache the workers map. Other modes load the
+    backend, which also exports the ONNX model once.
+    """
+    if name in ("torch", "torch-int8") and settings.embedding_model_load == "mmap":
+        AutoTokenizer.from_pretrained(model_name)
+        AutoConfig.from_pretrained(model_name)
+        path = find_checkpoint(model_name)
+        if path is not None:
+            with open(path, "rb") as f:
+                while f.read(16 * 1024 * 1024):
+                    pass
+            return
+    load_backend(name, model_name)
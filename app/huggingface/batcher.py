@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+
+from app.huggingface.embedding import EmbeddingService
+from app.huggingface.inference import InferenceExecutor, InferenceQueueFull, inference_executor
+from app.metrics import query_batch_size
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding calls into batched forward passes.
+
+    Callers put their text on an asyncio queue and await a future. A dispatcher task takes the first
+    waiting text, adds whatever else is already queued (waiting at most `max_wait_ms` for more) up to
+    `max_batch_size`, runs one EmbeddingService.embed call on the inference executor and resolves every
+    caller's future with its row. While all inference workers are busy new texts keep queueing, so batches
+    grow with load, and a lone request at low load is dispatched after at most `max_wait_ms`.
+
+    Methods:
+        - embed(text): Awaitable embedding of a single text.
+        - stats(): Returns the batch size histogram and queue depth.
+        - close(): Cancels the dispatcher task.
+    """
+
+    def __init__(
+        self,
+        embedding_service: EmbeddingService,
+        executor: InferenceExecutor = inference_executor,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        max_queue: Optional[int] = None,
+    ):
+        self.embedding_service = embedding_service
+        self.executor = executor
+        self.max_batch_size = max_batch_size or settings.embedding_batch_max_size
+        self.max_wait_ms = settings.embedding_batch_max_wait_ms if max_wait_ms is None else max_wait_ms
+        self.max_queue = max_queue or settings.inference_max_queue
+        self.batch_sizes: Counter = Counter()
+        self._queue: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+
+    def _start(self) -> asyncio.Queue:
+        """Return the queue of the dispatcher, starting one in the running loop if there is none."""
+        if self._queue is None or self._dispatcher is None or self._dispatcher.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._dispatcher = asyncio.create_task(self._dispatch_loop(self._queue))
+        return self._queue
+
+    async def embed(self, text: str) -> np.ndarray:
+        queue = self._start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            raise InferenceQueueFull(f"{queue.qsize()} queries waiting for a batch")
+        return await future
+
+    async def _collect(self, queue: asyncio.Queue, first) -> list:
+        batch = [first]
+        while len(batch) < self.max_batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch_loop(self, queue: asyncio.Queue) -> None:
+        slots = asyncio.Semaphore(self.executor.max_workers)
+        while True:
+            first = await queue.get()
+            await slots.acquire()
+            batch = await self._collect(queue, first)
+            task = asyncio.create_task(self._run_batch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run_batch(self, batch: list) -> None:
+        self.batch_sizes[len(batch)] += 1
+        query_batch_size.observe(len(batch))
+        try:
+            vectors = await self.executor.run(self.embedding_service.embed, [text for text, _ in batch])
+        except Exception as e:
+            logger.error(f"Batched embedding of {len(batch)} queries failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():  # the caller may have gone away
+                future.set_result(vector)
+
+    def stats(self) -> dict:
+        batches = sum(self.batch_sizes.values())
+        return {
+            "batches": batches,
+            "mean_batch_size": sum(size * count for size, count in self.batch_sizes.items()) / batches if batches else 0.0,
+            "batch_size_histogram": {str(size): self.batch_sizes[size] for size in sorted(self.batch_sizes)},
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+        }
+
+    async def close(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Sequence, cast
+
+import numpy as np
+import redis
+
+from app.metrics import embedding_cache_lookups
+from app.settings import settings
+from app.tasks import redis_conn
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "emb"
+REDIS_BATCH_SIZE = 1000
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace, which does not change the tokenization of the text."""
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    """Stable hash of the normalized text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-process LRU in front of redis.
+
+    Keys are built from a namespace (`EmbeddingService.vector_namespace`) and the hash of the normalized text,
+    values are stored as little-endian float32 bytes with a TTL. Redis failures are logged and treated as misses.
+
+    Methods:
+        - make_key(namespace, text): Builds the cache key of a text.
+        - get_many(keys): Returns cached vectors (or None) for the keys.
+        - set_many(items): Stores vectors in both tiers.
+        - stats(): Returns the hit/miss counters.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = redis_conn, max_items: Optional[int] = None, ttl_s: Optional[int] = None):
+        self.redis_client = redis_client
+        self.max_items = max_items or settings.embedding_cache_local_max_items
+        self.ttl_s = ttl_s or settings.embedding_cache_ttl_s
+        self._local: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis_configured = False
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def make_key(namespace: str, text: str) -> str:
+        return f"{KEY_PREFIX}:{namespace}:{text_hash(text)}"
+
+    def _configure_redis(self, redis_client: redis.Redis) -> None:
+        """Apply the eviction settings once, if configured."""
+        self._redis_configured = True
+        if settings.embedding_cache_redis_maxmemory:
+            redis_client.config_set("maxmemory", settings.embedding_cache_redis_maxmemory)
+            redis_client.config_set("maxmemory-policy", settings.embedding_cache_redis_maxmemory_policy)
+
+    def _get_local(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._local.get(key)
+            if vector is not None:
+                self._local.move_to_end(key)
+            return vector
+
+    def _set_local(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._local[key] = vector
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_items:
+                self._local.popitem(last=False)
+
+    def get_many(self, keys: Sequence[str]) -> list:
+        """Look keys up in the local LRU first, then in redis.
+
+        Returns:
+            list: a float32 vector or None per key.
+        """
+        vectors = [self._get_local(key) for key in keys]
+        local_hits = sum(vector is not None for vector in vectors)
+        remote = [i for i, vector in enumerate(vectors) if vector is None]
+
+        redis_hits = 0
+        if remote and self.redis_client is not None:
+            try:
+                if not self._redis_configured:
+                    self._configure_redis(self.redis_client)
+                for start in range(0, len(remote), REDIS_BATCH_SIZE):
+                    batch = remote[start : start + REDIS_BATCH_SIZE]
+                    for i, value in zip(batch, cast(list, self.redis_client.mget([keys[i] for i in batch]))):
+                        if value is not None:
+                            vector = np.frombuffer(value, dtype="<f4")
+                            vectors[i] = vector
+                            self._set_local(keys[i], vector)
+                            redis_hits += 1
+            except redis.RedisError as e:
+                self.redis_errors += 1
+                logger.warning(f"Embedding cache lookup failed, treating as misses: {e}")
+
+        with self._lock:
+            self.local_hits += local_hits
+            self.redis_hits += redis_hits
+            self.misses += len(keys) - local_hits - redis_hits
+        embedding_cache_lookups.labels("local_hit").inc(local_hits)
+        embedding_cache_lookups.labels("redis_hit").inc(redis_hits)
+        embedding_cache_lookups.labels("miss").inc(len(keys) - local_hits - redis_hits)
+        return vectors
+
+    def set_many(self, items: dict) -> None:
+        """Store {key: vector} in both tiers."""
+        for key, vector in items.items():
+            self._set_local(key, vector)
+
+        if items and self.redis_client is not None:
+            try:
+                with self.redis_client.pipeline(transaction=False) as pipe:
+                    for i, (key, vector) in enumerate(items.items(), start=1):
+                        pipe.setex(key, self.ttl_s, np.asarray(vector, dtype="<f4").tobytes())
+                        if i % REDIS_BATCH_SIZE == 0:
+                            pipe.execute()
+                    pipe.execute()
+            except redis.RedisError as e:
+                self.redis_errors += 1
+                logger.warning(f"Embedding cache write failed: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "hit_rate": (self.local_hits + self.redis_hits) / lookups if lookups else 0.0,
+            "local_items": len(self._local),
+        }
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,125 @@
+import logging
+from typing import Optional, Sequence
+
+import numpy as np
+import torch
+
+from app.huggingface.cache import EmbeddingCache, embedding_cache
+from app.huggingface.manager import ModelManager
+from app.metrics import embedding_batch_size, timed
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+POOLING_MODES = ("cls", "mean")
+
+
+def pool(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor, pooling: str) -> torch.Tensor:
+    """Reduce token states (batch, tokens, hidden) to one vector per text.
+
+    Args:
+        last_hidden_state: model output.
+        attention_mask: 1 for real tokens, 0 for padding.
+        pooling: "cls" takes the first token, "mean" averages the non-padding tokens.
+
+    Returns:
+        torch.Tensor: pooled states of shape (batch, hidden).
+    """
+    if pooling == "cls":
+        return last_hidden_state[:, 0]
+    if pooling == "mean":
+        mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+        return (last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+    raise ValueError(f"Unknown pooling mode: {pooling}, expected one of {POOLING_MODES}")
+
+
+class EmbeddingService:
+    """
+    Batched sentence-embedding engine on top of the ModelManager inference backend.
+
+    Texts are tokenized once, ordered by token length and run through the model in micro-batches,
+    so each batch is only padded up to its own longest member. Token states are pooled ("cls" or "mean")
+    into one fixed-size vector per text and optionally L2-normalized, so cosine similarity is a dot product.
+    Texts already in the embedding cache (or repeated within the call) are only embedded once.
+
+    Methods:
+        - embed(texts): Returns a contiguous float32 matrix with one row per input text.
+        - warm_up(): Loads the model and runs one forward pass.
+    """
+
+    def __init__(
+        self,
+        model_manager: Optional[ModelManager] = None,
+        batch_size: Optional[int] = None,
+        max_length: Optional[int] = None,
+        pooling: Optional[str] = None,
+        normalize: Optional[bool] = None,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.model_manager = model_manager or ModelManager()
+        self.batch_size = batch_size or settings.embedding_batch_size
+        self.max_length = max_length or settings.embedding_max_length
+        self.pooling = pooling or settings.embedding_pooling
+        self.normalize = settings.embedding_normalize if normalize is None else normalize
+        if self.pooling not in POOLING_MODES:
+            raise ValueError(f"Unknown pooling mode: {self.pooling}, expected one of {POOLING_MODES}")
+        self.cache = cache or (embedding_cache if settings.embedding_cache_enabled else None)
+        # cache key prefix and label of the stored chunk vectors: vectors are only reused by a service with the
+        # same model, backend, max length, pooling and normalization
+        self.vector_namespace = f"{settings.embedding_model_name}:{settings.embedding_backend}:{self.max_length}:{self.pooling}{':l2' if self.normalize else ''}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Embed a list of texts, going through the embedding cache when enabled.
+
+        Args:
+            texts: texts to embed.
+
+        Returns:
+            np.ndarray: float32 matrix of shape (len(texts), embedding_dim), rows in input order.
+        """
+        if self.cache is None or not texts:
+            return self._embed(texts)
+
+        keys = [self.cache.make_key(self.vector_namespace, text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # repeated texts share a key, so they are embedded once
+        missing = {key: text for key, text, vector in zip(keys, texts, cached) if vector is None}
+        if missing:
+            computed = dict(zip(missing.keys(), self._embed(list(missing.values()))))
+            self.cache.set_many(computed)
+            cached = [computed[key] if vector is None else vector for key, vector in zip(keys, cached)]
+        return np.stack(cached).astype(np.float32, copy=False)
+
+    def warm_up(self) -> None:
+        """Load the model and run one uncached forward pass, so the first real call does not pay for it."""
+        self._embed(["warm up"])
+
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Run texts through the model in length-bucketed micro-batches."""
+        backend = self.model_manager.get_model()
+        if backend is None:
+            raise RuntimeError("Failed to load the embedding model.")
+
+        tokenizer = backend.tokenizer
+        embeddings = np.empty((len(texts), backend.hidden_size), dtype=np.float32)
+        if not texts:
+            return embeddings
+
+        encoded = tokenizer(list(texts), truncation=True, max_length=self.max_length)
+        # length bucketing: neighbours in this order have similar lengths, so padding stays minimal
+        order = sorted(range(len(texts)), key=lambda i: len(encoded["input_ids"][i]))
+
+        with torch.inference_mode(), timed("embed"):
+            for start in range(0, len(order), self.batch_size):
+                batch_indices = order[start : start + self.batch_size]
+                embedding_batch_size.observe(len(batch_indices))
+                features = tokenizer.pad({key: [encoded[key][i] for i in batch_indices] for key in encoded.keys()}, return_tensors="pt")
+                last_hidden_state = backend.forward(features)
+                pooled = pool(last_hidden_state, features["attention_mask"], self.pooling)
+                if self.normalize:
+                    pooled = torch.nn.functional.normalize(pooled, p=2, dim=-1)
+                embeddings[batch_indices] = pooled.float().cpu().numpy()
+
+        logger.debug(f"Embedded {len(texts)} texts in {(len(texts) + self.batch_size - 1) // self.batch_size} batches")
+        return embeddings
@@ -0,0 +1,49 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when more inference calls are waiting than `inference_max_queue` allows."""
+
+
+class InferenceExecutor:
+    """
+    Bounded executor that runs model inference off the event loop.
+
+    At most `max_workers` forward passes run at the same time (torch releases the GIL inside its kernels),
+    up to `max_queue` further calls wait for a free worker and anything beyond that is rejected
+    with InferenceQueueFull instead of piling up unbounded latency.
+
+    Methods:
+        - run(fn, *args): Awaitable call of fn(*args) on an inference thread.
+        - shutdown(): Stops the worker threads.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.max_workers = max_workers or settings.inference_max_workers
+        self.max_queue = settings.inference_max_queue if max_queue is None else max_queue
+        self.pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="inference")
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        if self.pending >= self.max_workers + self.max_queue:
+            raise InferenceQueueFull(f"{self.pending} inference calls pending")
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+inference_executor = InferenceExecutor()
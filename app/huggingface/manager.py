@@ -1,4 +1,7 @@
-from transformers import pipeline
+import threading
+
+from app.huggingface.backends import load_backend, prefetch_model
+from app.settings import settings
 
 
 class ModelManager:
@@ -7,39 +10,51 @@ class ModelManager:
     required for text processing tasks.
 
     This ensures that the model is loaded only once and can be reused throughout the application,
-    improving efficiency and performance.
+    improving efficiency and performance. Loading is lazy: it happens on the first get_model() call
+    (or an explicit warm-up), so importing modules that hold a ModelManager stays cheap.
 
     Attributes:
-        - model: Holds the pipeline for feature extraction (embedding).
+        - model: Holds the inference backend (tokenizer and forward pass) selected by `embedding_backend`.
 
     Methods:
         - initialize_model(): Initializes the embedding model.
-        - get_model(): Returns the initialized embedding model.
+        - get_model(): Returns the embedding model, loading it on first use.
+        - prefetch(): Downloads the model files without keeping the model in this process.
+        - is_loaded: Whether the model has been loaded.
     """
 
     _instance = None
-
-    def __init__(self):
-        if not self.model:
-            self.initialize_model()
+    _lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ModelManager, cls).__new__(cls)
             cls._instance.model = None
-            cls._instance.initialize_model()
         return cls._instance
 
     def initialize_model(self):
-        """Initializes the embedding model using the BGE-3 model."""
-        if self.model is None:
-            print("Loading the BGE-3 model...")
-            self.model = pipeline("feature-extraction", model="BAAI/bge-large-en")
-            print(f"Model initialized: {self.model}")
+        """Initializes the embedding model (`embedding_model_name`) with the configured backend."""
+        with self._lock:
+            if self.model is not None:
+                return
+            print(f"Loading the {settings.embedding_model_name} model with the {settings.embedding_backend} backend...")
+            model = load_backend(settings.embedding_backend, settings.embedding_model_name)
+            if model.hidden_size != settings.embedding_dim:
+                raise RuntimeError(f"{settings.embedding_model_name} produces {model.hidden_size}-dim vectors but embedding_dim is {settings.embedding_dim}")
+            self.model = model
             print("Model loaded successfully.")
 
     def get_model(self):
-        """Returns the initialized embedding model."""
+        """Returns the embedding model, loading it on first use."""
         if self.model is None:
-            print("Warning: Model accessed before initialization")
+            self.initialize_model()
         return self.model
+
+    @staticmethod
+    def prefetch():
+        """Downloads the model files (and warms the page cache of a memory mapped checkpoint) for the worker processes."""
+        prefetch_model(settings.embedding_backend, settings.embedding_model_name)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
@@ -1,11 +1,23 @@
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 from app.api import qa
+from app.database import crud
+from app.database.session import db_context
+from app.huggingface.inference import inference_executor
+from app.huggingface.manager import ModelManager
+from app.metrics import render, update_queue_depths
+from app.profiling import profile_request
+from app.settings import settings
+from app.tasks import broker
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
@@ -14,7 +26,28 @@ logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 API_PORT = int(os.getenv("API_PORT", 8001))
-app = FastAPI()
+
+
+async def warm_up_model() -> None:
+    """Load the model on an inference thread while the API already serves requests."""
+    try:
+        await inference_executor.run(qa.embedding_service.warm_up)
+        logger.info("Embedding model warmed up.")
+    except Exception as e:
+        logger.error(f"Model warm-up failed, it will be retried on first use: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the model warm-up in the background; release the batcher and inference threads on shutdown."""
+    if settings.model_warmup_on_startup:
+        app.state.warm_up = asyncio.create_task(warm_up_model())
+    yield
+    await qa.embedding_batcher.close()
+    inference_executor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 STATIC_DIR = os.getenv("STATIC_DIR", "static")
 TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "templates")
@@ -23,6 +56,9 @@ TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "templates")
 # Include routers
 app.include_router(qa.router, tags=["qa"])
 
+if settings.profiling_enabled:
+    app.middleware("http")(profile_request)
+
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError) -> JSONResponse:
@@ -53,5 +89,45 @@ async def ping():
     return "pong"
 
 
+def check_database() -> bool:
+    with db_context() as db_session:
+        return crud.ping(db_session)
+
+
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    """
+    Readiness endpoint, unlike /ping it checks the dependencies of /qa/.
+    Returns 200 once the embedding model is loaded and the database answers, 503 otherwise.
+    """
+    model_loaded = ModelManager().is_loaded
+    try:
+        database = await run_in_threadpool(check_database)
+    except Exception as e:
+        logger.warning(f"Readiness check could not reach the database: {e}")
+        database = False
+
+    content = {"model_loaded": model_loaded, "database": database}
+    return JSONResponse(content=content, status_code=status.HTTP_200_OK if model_loaded and database else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def collect_metrics() -> tuple:
+    try:
+        update_queue_depths(broker)
+    except Exception as e:
+        logger.warning(f"Unable to read the dramatiq queue depths: {e}")
+    return render()
+
+
+@app.get("/metrics")
+async def metrics() -> Response:
+    """
+    Prometheus metrics of this API process: stage latencies, batch sizes, cache hit counters
+    and the number of messages waiting in each dramatiq queue.
+    """
+    body, content_type = await run_in_threadpool(collect_metrics)
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=API_PORT)
@@ -0,0 +1,51 @@
+"""Prometheus metrics of the API and the workers.
+
+The API serves them at /metrics. Workers run the dramatiq Prometheus middleware, which serves the
+metrics of every worker process (message counts and durations per actor, and the ones below) on
+port `dramatiq_prom_port`, 9191 by default. bin/run_dramatiq sets PROMETHEUS_MULTIPROC_DIR so the
+worker processes share their values through files.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# download, extract, chunk, embed, db_write, document_lookup, query_embed, search, serialize
+stage_seconds = Histogram("rag_stage_seconds", "Wall time of a pipeline or request stage.", ["stage"], buckets=STAGE_BUCKETS)
+embedding_batch_size = Histogram("rag_embedding_batch_size", "Texts per model forward pass.", buckets=BATCH_BUCKETS)
+query_batch_size = Histogram("rag_query_batch_size", "Queries coalesced by the embedding batcher.", buckets=BATCH_BUCKETS)
+embedding_cache_lookups = Counter("rag_embedding_cache_lookups", "Embedding cache lookups by result.", ["result"])  # local_hit, redis_hit, miss
+qa_cache_lookups = Counter("rag_qa_cache_lookups", "/qa/ result cache lookups by result.", ["result"])  # local_hit, redis_hit, shared, miss
+memory_index_lookups = Counter("rag_memory_index_lookups", "In-memory index lookups by result.", ["result"])  # hit, miss
+queue_depth = Gauge("rag_queue_depth", "Messages waiting in a dramatiq queue.", ["queue"], multiprocess_mode="livemax")
+
+
+@contextmanager
+def timed(stage: str):
+    """Observe the wall time of the block in rag_stage_seconds{stage=...}, also when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.labels(stage).observe(time.perf_counter() - start)
+
+
+def update_queue_depths(broker) -> None:
+    """Read the number of waiting messages of every declared queue of a dramatiq RedisBroker."""
+    for queue_name in broker.get_declared_queues():
+        queue_depth.labels(queue_name).set(broker.client.llen(f"{broker.namespace}:{queue_name}"))
+
+
+def render() -> tuple:
+    """Return (body, content type) of the Prometheus text exposition of this process, or of all processes in multiprocess mode."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,6 +1,9 @@
 from enum import Enum
+from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from app.settings import settings
 
 
 class DocumentStatusEnum(str, Enum):
@@ -23,8 +26,14 @@ class DocumentEventsEnum(str, Enum):
     EMBEDDING_FAILED = "embedding_failed"
 
 
+class RetrievalModeEnum(str, Enum):
+    VECTOR = "vector"
+    HYBRID = "hybrid"
+
+
 class UploadDocumentRequest(BaseModel):
     url: str
+    tags: list[str] = []
 
 
 class UploadDocumentResponse(BaseModel):
@@ -32,10 +41,77 @@ class UploadDocumentResponse(BaseModel):
     status: DocumentStatusEnum
 
 
-class QARequest(BaseModel):
+class BatchUploadRequest(BaseModel):
+    urls: list[str] = Field(min_length=1, max_length=settings.batch_max_items)
+    tags: list[str] = []  # applied to the new documents
+
+
+class BatchUploadResponse(BaseModel):
+    documents: list[UploadDocumentResponse]  # in the order of the urls
+
+
+class RetrievalOptions(BaseModel):
+    mode: RetrievalModeEnum = RetrievalModeEnum(settings.retrieval_mode)
+    # hybrid mode only, unset values use the hybrid_* settings
+    candidate_depth: Optional[int] = Field(default=None, ge=1, le=settings.hybrid_max_candidate_depth)
+    vector_weight: Optional[float] = Field(default=None, ge=0)
+    lexical_weight: Optional[float] = Field(default=None, ge=0)
+
+
+class IndexProgress(BaseModel):
+    pages_done: int
+    pages_total: int
+
+
+class DocumentStatusResponse(BaseModel):
+    document_id: int
+    status: DocumentStatusEnum
+    progress: Optional[IndexProgress] = None  # set while a large document is indexed in shards
+
+
+class QARequest(RetrievalOptions):
     url: str
     query: str
 
 
 class QAResponse(BaseModel):
     relevant_chunks: list[str]
+
+
+class QABatchItem(BaseModel):
+    url: str
+    query: str
+
+
+class QABatchRequest(RetrievalOptions):
+    items: list[QABatchItem] = Field(min_length=1, max_length=settings.batch_max_items)
+
+
+class QABatchResult(BaseModel):
+    """One NDJSON line of /qa/batch, lines arrive in completion order."""
+
+    index: int  # position of the item in the request
+    status_code: int = 200  # what /qa/ would have answered
+    relevant_chunks: list[str] = []
+    detail: Optional[str] = None
+
+
+class SearchRequest(RetrievalOptions):
+    query: str
+    document_ids: Optional[list[int]] = None  # None searches the whole corpus
+    tag: Optional[str] = None
+    k: int = Field(default=settings.qa_top_k, ge=1, le=settings.search_max_k)
+    score_threshold: Optional[float] = None  # cosine similarity, applies to the vector candidates
+
+
+class SearchHit(BaseModel):
+    chunk_id: int
+    document_id: int
+    page_start: Optional[int] = None
+    page_end: Optional[int] = None
+    score: float  # cosine similarity, or the fused rank score in hybrid mode
+    text: str
+
+
+class SearchResponse(BaseModel):
+    hits: list[SearchHit]
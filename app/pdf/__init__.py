@@ -0,0 +1 @@
+"""PDF processing."""
@@ -0,0 +1,146 @@
+import logging
+import re
+from collections import deque
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Sequence
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# special tokens ([CLS], [SEP]) added around every chunk by the embedding model
+SPECIAL_TOKENS = 2
+
+LengthFunction = Callable[[list[str]], list[int]]
+
+
+class Chunk(NamedTuple):
+    text: str
+    page_start: int
+    page_end: int
+
+
+def token_length_function(model_name: Optional[str] = None) -> LengthFunction:
+    """Count tokens with the embedding model tokenizer, without loading the model itself."""
+    from transformers import AutoTokenizer  # only needed once a chunker without a length function runs
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name or settings.embedding_model_name)
+
+    def length(texts: list[str]) -> list[int]:
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False, verbose=False)["input_ids"]]
+
+    return length
+
+
+class RecursiveChunker:
+    """
+    Token-aware recursive text splitter that runs across page boundaries.
+
+    Every page is split on the first separator it contains; pieces still longer than `chunk_size`
+    tokens are split again with the remaining separators. Separators stay attached to the end of
+    their piece, so joining pieces gives back the original text. Pieces are then packed into chunks
+    of at most `chunk_size` tokens, carrying about `chunk_overlap` tokens of the previous chunk over,
+    and chunks may span pages. Pages are consumed one at a time, so the document is never held as
+    one string, and every piece is tokenized a bounded number of times (once per separator level).
+
+    Chunk lengths are the sum of their piece lengths, which is exact for WordPiece tokenizers as long
+    as pieces end on whitespace or punctuation.
+
+    Methods:
+        - split_text(text): Returns (piece, tokens) pairs of at most chunk_size tokens each.
+        - chunk_pages(pages): Yields Chunks from (page_number, text) pairs.
+    """
+
+    def __init__(
+        self,
+        length_function: Optional[LengthFunction] = None,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None,
+        separators: Optional[Sequence[str]] = None,
+    ):
+        self._length_function = length_function
+        self.chunk_size = min(chunk_size or settings.chunk_size, settings.embedding_max_length - SPECIAL_TOKENS)
+        self.chunk_overlap = settings.chunk_overlap if chunk_overlap is None else chunk_overlap
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError(f"chunk_overlap ({self.chunk_overlap}) must be smaller than chunk_size ({self.chunk_size})")
+        self.separators = list(settings.separators if separators is None else separators)
+        self._patterns = [re.compile(sep if sep.startswith("(?") else re.escape(sep)) if sep else None for sep in self.separators]
+
+    @property
+    def length_function(self) -> LengthFunction:
+        """Tokenizer based length, loaded on first use."""
+        if self._length_function is None:
+            self._length_function = token_length_function()
+        return self._length_function
+
+    def _split(self, text: str, separator: str, pattern: Optional[re.Pattern]) -> list[str]:
+        """Split text after every separator match, keeping the separator on the left piece."""
+        if pattern is None:
+            return list(text)
+        pieces, start = [], 0
+        for match in pattern.finditer(text):
+            if match.end() > start:
+                pieces.append(text[start : match.end()])
+                start = match.end()
+        if start < len(text):
+            pieces.append(text[start:])
+        return pieces
+
+    def split_text(self, text: str, level: int = 0) -> list[tuple[str, int]]:
+        """Recursively split text into pieces of at most chunk_size tokens.
+
+        Returns:
+            list: (piece, token count) pairs in text order.
+        """
+        # first separator (from `level` on) present in the text, "" always matches
+        separator, pattern = "", None
+        for i in range(level, len(self.separators)):
+            separator, pattern, level = self.separators[i], self._patterns[i], i
+            if pattern is None or pattern.search(text):
+                break
+
+        splits = [split for split in self._split(text, separator, pattern) if split]
+        pieces = []
+        for split, length in zip(splits, self.length_function(splits)):
+            if length <= self.chunk_size or not separator or level + 1 >= len(self.separators):
+                pieces.append((split, length))
+            else:
+                pieces.extend(self.split_text(split, level + 1))
+        return pieces
+
+    def chunk_pages(self, pages: Iterable[tuple[int, str]]) -> Iterator[Chunk]:
+        """Pack the pieces of consecutive pages into overlapping chunks.
+
+        Args:
+            pages: (page_number, text) pairs in page order, e.g. from iter_pages().
+
+        Yields:
+            Chunk: text with the first and last page it was taken from.
+        """
+        window: deque = deque()  # (piece, tokens, page_number)
+        tokens = 0
+        fresh = 0  # pieces in the window not yet emitted in a chunk
+
+        for page_number, text in pages:
+            if not text or not text.strip():
+                continue
+            if not text[-1].isspace():
+                text += "\n"  # never glue the last word of a page to the first word of the next one
+
+            for piece, length in self.split_text(text):
+                if window and tokens + length > self.chunk_size:
+                    if fresh:
+                        yield self._make_chunk(window)
+                        fresh = 0
+                    # keep the tail of the window as overlap, as long as the next piece still fits
+                    while window and (tokens > self.chunk_overlap or tokens + length > self.chunk_size):
+                        tokens -= window.popleft()[1]
+                window.append((piece, length, page_number))
+                tokens += length
+                fresh += 1
+
+        if fresh:
+            yield self._make_chunk(window)
+
+    @staticmethod
+    def _make_chunk(window: deque) -> Chunk:
+        return Chunk(text="".join(piece for piece, _, _ in window).strip(), page_start=window[0][2], page_end=window[-1][2])
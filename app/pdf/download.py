@@ -0,0 +1,120 @@
+"""Streaming PDF download with a shared, pooled HTTP client, run by the extraction stage."""
+
+import hashlib
+import logging
+import os
+import uuid
+from typing import NamedTuple, Optional
+
+import httpx
+
+from app.metrics import timed
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+http_client: Optional[httpx.Client] = None
+
+# client errors worth retrying, the others raise DownloadRejected
+RETRYABLE_STATUS_CODES = (408, 425, 429)
+
+
+class DownloadRejected(Exception):
+    """The document cannot be downloaded: too large or refused by the server. Not retried."""
+
+
+class Download(NamedTuple):
+    file_path: str
+    file_hash: str  # sha256 of the body
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+def get_http_client() -> httpx.Client:
+    """Return the process wide client, keep-alive connections are reused across downloads."""
+    global http_client
+    if http_client is None:
+        http_client = httpx.Client(
+            follow_redirects=True,
+            timeout=httpx.Timeout(settings.download_timeout_s, connect=settings.download_connect_timeout_s),
+            limits=httpx.Limits(max_connections=settings.download_max_connections, max_keepalive_connections=settings.download_max_connections),
+        )
+    return http_client
+
+
+def close_http_client() -> None:
+    global http_client
+    if http_client is not None:
+        http_client.close()
+        http_client = None
+
+
+def check_response(response: httpx.Response) -> None:
+    """Raise DownloadRejected for client errors and bodies over `download_max_bytes`, httpx errors for the rest."""
+    if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_STATUS_CODES:
+        raise DownloadRejected(f"{response.url} answered {response.status_code}")
+    response.raise_for_status()
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.download_max_bytes:
+        raise DownloadRejected(f"{response.url} is {content_length} bytes, more than {settings.download_max_bytes}")
+
+
+def download_to_file(url: str, file_path: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[Download]:
+    """Stream the response body of url into file_path.
+
+    The body is written chunk by chunk into a temporary file that is renamed into place,
+    so readers never see a partially written PDF. With `etag` or `last_modified` of a previous
+    download the request is conditional.
+
+    Returns:
+        Download: with file_path, or None if the server answered 304 Not Modified.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    tmp_path = f"{file_path}.part"
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with timed("download"), get_http_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304:
+                logger.info(f"{url} is not modified")
+                return None
+            check_response(response)
+            with open(tmp_path, "wb") as f:
+                for data in response.iter_bytes(settings.download_chunk_size):
+                    size += len(data)
+                    if size > settings.download_max_bytes:
+                        raise DownloadRejected(f"{url} is larger than {settings.download_max_bytes} bytes")
+                    f.write(data)
+                    digest.update(data)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logger.info(f"Downloaded {url} to {file_path} ({size} bytes)")
+    return Download(file_path, digest.hexdigest(), response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+
+def download_document(url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> Optional[Download]:
+    """Download a PDF into `pdfs_data_dir`, stored under its content hash.
+
+    Identical PDFs share one file whatever their URL, and a new version of a URL never overwrites
+    the file another document was indexed from.
+
+    Returns:
+        Download: the stored file, or None if the validators of the previous download still match.
+    """
+    os.makedirs(settings.pdfs_data_dir, exist_ok=True)
+    download_path = os.path.join(settings.pdfs_data_dir, f"{uuid.uuid4().hex}.download")
+    download = download_to_file(url, download_path, etag=etag, last_modified=last_modified)
+    if download is None:
+        return None
+    file_path = os.path.join(settings.pdfs_data_dir, f"{download.file_hash}.pdf")
+    os.replace(download_path, file_path)
+    return download._replace(file_path=file_path)
@@ -0,0 +1,41 @@
+"""Opt-in sampling profiles of single API requests.
+
+With `profiling_enabled`, a request sent with the `X-Profile: 1` header runs under pyinstrument and its
+profile is written as HTML into `profiling_dir`; the response names the file in its `X-Profile` header.
+Other requests are not sampled, and the middleware is not installed at all when profiling is disabled.
+"""
+
+import logging
+import os
+import time
+
+from fastapi import Request
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+
+
+async def profile_request(request: Request, call_next):
+    """HTTP middleware sampling the requests that ask for it."""
+    if request.headers.get(PROFILE_HEADER) != "1":
+        return await call_next(request)
+
+    from pyinstrument import Profiler
+
+    profiler = Profiler(interval=settings.profiling_interval_s, async_mode="enabled")
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+
+    os.makedirs(settings.profiling_dir, exist_ok=True)
+    file_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.url.path.strip('/').replace('/', '_') or 'root'}-{os.getpid()}-{time.monotonic_ns()}.html"
+    with open(os.path.join(settings.profiling_dir, file_name), "w") as f:
+        f.write(profiler.output_html())
+    logger.info(f"Profile of {request.method} {request.url.path} written to {file_name}")
+    response.headers[PROFILE_HEADER] = file_name
+    return response
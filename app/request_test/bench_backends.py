@@ -0,0 +1,104 @@
+"""Benchmark and parity check of the embedding backends.
+
+Every backend runs in its own process, so load time and RSS are measured in isolation. Embeddings of
+every backend are compared with the torch fp32 reference of the same model; the script exits with
+status 1 when the minimum cosine agreement is below --min-cosine.
+tests/test_backends.py asserts the same agreement on a small local model.
+
+Usage:
+    python3 -m app.request_test.bench_backends --backends torch torch-int8 onnx --texts 256
+    python3 -m app.request_test.bench_backends --model BAAI/bge-small-en-v1.5 --backends torch onnx
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.request_test.bench_embedding import make_chunks
+from app.settings import settings
+
+
+def run_backend(backend, model_name, texts, output_path):
+    """Child process: load one backend, embed texts, save the matrix and print metrics as JSON."""
+    from app.huggingface.backends import load_backend
+    from app.huggingface.embedding import EmbeddingService
+
+    class StaticManager:
+        def __init__(self, model):
+            self.model = model
+
+        def get_model(self):
+            return self.model
+
+    start = time.perf_counter()
+    model = load_backend(backend, model_name)
+    load_s = time.perf_counter() - start
+
+    embedding_service = EmbeddingService(model_manager=StaticManager(model))
+    embedding_service.cache = None
+    embedding_service.embed(texts[:8])
+
+    start = time.perf_counter()
+    matrix = embedding_service.embed(texts)
+    batch_s = time.perf_counter() - start
+
+    query_latencies = []
+    for text in texts[:32]:
+        start = time.perf_counter()
+        embedding_service.embed([text])
+        query_latencies.append((time.perf_counter() - start) * 1000)
+
+    np.save(output_path, matrix)
+    print(
+        json.dumps(
+            {
+                "load_s": load_s,
+                "texts_per_sec": len(texts) / batch_s,
+                "query_p50_ms": float(np.percentile(query_latencies, 50)),
+                "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"])
+    parser.add_argument("--model", default=settings.embedding_model_name)
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    texts = make_chunks(args.texts)
+    if args.child:
+        run_backend(args.child, args.model, texts, args.output)
+        sys.exit(0)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        matrices = {}
+        for backend in ["torch", *[backend for backend in args.backends if backend != "torch"]]:
+            output = os.path.join(tmp_dir, f"{backend}.npy")
+            command = [sys.executable, "-m", "app.request_test.bench_backends", "--child", backend, "--model", args.model, "--texts", str(args.texts), "--output", output]
+            result = subprocess.run(command, capture_output=True, text=True, check=True)
+            metrics = json.loads(result.stdout.strip().splitlines()[-1])
+            matrices[backend] = np.load(output)
+
+            cosine = np.sum(matrices["torch"] * matrices[backend], axis=1) / (np.linalg.norm(matrices["torch"], axis=1) * np.linalg.norm(matrices[backend], axis=1))
+            failed |= bool(cosine.min() < args.min_cosine)
+            print(
+                f"{backend:10s} load {metrics['load_s']:6.1f} s | {metrics['texts_per_sec']:7.1f} texts/sec | "
+                f"query p50 {metrics['query_p50_ms']:7.1f} ms | max RSS {metrics['max_rss_mb']:7.0f} MB | "
+                f"cosine vs torch mean {cosine.mean():.4f} min {cosine.min():.4f}"
+            )
+
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,99 @@
+"""Benchmark: /qa/batch and /upload/batch against looping over /qa/ and /upload/.
+
+Runs against a running API. `--queries` queries go through single /qa/ calls (`--clients` at a time)
+and as many through /qa/batch requests of `--batch-size` items, the NDJSON lines are counted as they
+arrive. The query texts differ between the two, so the embedding cache helps neither side.
+With --upload-template, as many new urls are uploaded one by one and in batches (they are real
+documents the workers will download, point it at a scratch deployment).
+
+Usage:
+    python3 -m app.request_test.bench_batch --url https://s29.q4cdn.com/175625835/files/doc_downloads/test.pdf --queries 1000 --batch-size 250
+    python3 -m app.request_test.bench_batch --url ... --upload-template "http://files.local/doc-{run}-{i}.pdf" --uploads 500
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from app.request_test.load_test import BASE_URL, QUERIES
+
+
+def make_queries(count, tag, seed=0):
+    """Distinct queries per run and per endpoint, so neither side is answered from the embedding cache."""
+    rng = random.Random(seed)
+    return [f"{rng.choice(QUERIES)} ({tag} {i})" for i in range(count)]
+
+
+async def loop_single(client, path, payloads, clients):
+    errors = 0
+
+    async def client_loop(chunk):
+        nonlocal errors
+        for payload in chunk:
+            response = await client.post(path, json=payload)
+            errors += response.status_code >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(payloads[i::clients]) for i in range(clients)))
+    return time.perf_counter() - start, errors
+
+
+async def qa_batches(client, url, queries, batch_size):
+    first_line_s, lines, errors = None, 0, 0
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        items = [{"url": url, "query": query} for query in queries[offset : offset + batch_size]]
+        async with client.stream("POST", "/qa/batch", json={"items": items}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                if first_line_s is None:
+                    first_line_s = time.perf_counter() - start
+                lines += 1
+                errors += json.loads(line)["status_code"] >= 400
+    return time.perf_counter() - start, first_line_s, lines, errors
+
+
+async def upload_batches(client, urls, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(urls), batch_size):
+        response = await client.post("/upload/batch", json={"urls": urls[offset : offset + batch_size]})
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run(args):
+    run_id = int(time.time())
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=600, limits=httpx.Limits(max_connections=args.clients + 1)) as client:
+        queries = make_queries(args.queries, f"single {run_id}")
+        elapsed, errors = await loop_single(client, "/qa/", [{"url": args.url, "query": query} for query in queries], args.clients)
+        print(f"/qa/ x{len(queries)}, {args.clients} clients: {elapsed:8.2f} s  {len(queries) / elapsed:8.1f} queries/s  errors {errors}")
+
+        queries = make_queries(args.queries, f"batch {run_id}")
+        elapsed, first_line_s, lines, errors = await qa_batches(client, args.url, queries, args.batch_size)
+        print(f"/qa/batch of {args.batch_size}:       {elapsed:8.2f} s  {lines / elapsed:8.1f} queries/s  " f"first line {first_line_s * 1000:.0f} ms  errors {errors}")
+
+        if args.upload_template:
+            urls = [args.upload_template.format(run=run_id, i=i) for i in range(2 * args.uploads)]
+            elapsed, errors = await loop_single(client, "/upload/", [{"url": url} for url in urls[: args.uploads]], args.clients)
+            print(f"/upload/ x{args.uploads}, {args.clients} clients: {elapsed:8.2f} s  {args.uploads / elapsed:8.1f} urls/s  errors {errors}")
+            elapsed = await upload_batches(client, urls[args.uploads :], args.batch_size)
+            print(f"/upload/batch of {args.batch_size}:   {elapsed:8.2f} s  {args.uploads / elapsed:8.1f} urls/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--url", required=True, help="URL of an already indexed document")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=250)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients of the single-item loops")
+    parser.add_argument("--upload-template", help="url pattern with {run} and {i}, uploads are skipped without it")
+    parser.add_argument("--uploads", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args))
@@ -0,0 +1,48 @@
+"""Benchmark: RecursiveChunker throughput, with the model tokenizer and with a plain word count.
+
+The word count run isolates the splitting/packing overhead from tokenization; both should scale
+linearly with the number of pages.
+
+Usage:
+    python3 -m app.request_test.bench_chunker --pages 100 1000
+"""
+
+import argparse
+import random
+import time
+
+from app.pdf.chunker import RecursiveChunker, token_length_function
+
+WORDS = "the report covers revenue growth operating margin guidance capital expenditure segment results outlook risk liquidity".split()
+
+
+def make_pages(count, seed=0):
+    """Pages of ~500 words in sentences and paragraphs."""
+    rng = random.Random(seed)
+    for page_number in range(1, count + 1):
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 25))).capitalize() + "." for _ in range(35)]
+        paragraphs = [" ".join(sentences[i : i + 5]) for i in range(0, len(sentences), 5)]
+        yield page_number, "\n\n".join(paragraphs)
+
+
+def word_length(texts):
+    return [len(text.split()) for text in texts]
+
+
+def bench(chunker, pages):
+    start = time.perf_counter()
+    chunks = sum(1 for _ in chunker.chunk_pages(make_pages(pages)))
+    elapsed = time.perf_counter() - start
+    return chunks, pages / elapsed, chunks / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 1000])
+    args = parser.parse_args()
+
+    for name, length_function in (("tokenizer", token_length_function()), ("word count", word_length)):
+        chunker = RecursiveChunker(length_function=length_function)
+        for pages in args.pages:
+            chunks, pages_per_sec, chunks_per_sec = bench(chunker, pages)
+            print(f"{name:10s} {pages:6d} pages -> {chunks:6d} chunks: {pages_per_sec:9.1f} pages/sec {chunks_per_sec:9.1f} chunks/sec")
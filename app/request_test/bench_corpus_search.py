@@ -0,0 +1,97 @@
+"""Benchmark: corpus-wide, multi-document and tag filtered search on synthetic data.
+
+Loads --chunks synthetic chunks spread over --documents documents (tagged `bench` and, for every
+tenth document, `bench-hot`), builds the ANN index and reports p50/p99 of crud.search_corpus.
+Vectors are drawn around random cluster centers, so the index sees realistic neighbourhoods.
+Use --keep to reuse the loaded data in the next run.
+
+Usage:
+    python3 -m app.request_test.bench_corpus_search --chunks 1000000 --documents 2000 --queries 200
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from app.database import crud
+from app.database.models import Document
+from app.database.session import db_context
+from app.settings import settings
+
+TAG = "bench"
+HOT_TAG = "bench-hot"
+
+
+def clustered_vectors(count, centers, rng):
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.3 * rng.standard_normal((count, centers.shape[1]), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load(db, chunks, documents, centers, rng):
+    per_document = chunks // documents
+    document_ids = []
+    for i in range(documents):
+        tags = [TAG, HOT_TAG] if i % 10 == 0 else [TAG]
+        document_id = crud.insert_document(db, file_path=f"bench-corpus-{i}.pdf", tags=tags)
+        vectors = clustered_vectors(per_document, centers, rng)
+        crud.bulk_insert_chunks(db, document_id, [f"document {i} chunk {j}" for j in range(per_document)], vectors, pages=[(j // 3 + 1, j // 3 + 1) for j in range(per_document)])
+        db.commit()
+        document_ids.append(document_id)
+        if i % 100 == 0:
+            print(f"loaded {i * per_document} chunks")
+
+    # building the index after the load is much faster than maintaining it row by row
+    db.execute(text(f"DROP INDEX IF EXISTS {crud.vector_index_name()}"))
+    db.commit()
+    start = time.perf_counter()
+    crud.create_vector_index()
+    db.execute(text("ANALYZE chunk_embeddings"))
+    db.commit()
+    print(f"index built in {time.perf_counter() - start:.1f} s")
+    return document_ids
+
+
+def percentiles(fn, queries):
+    latencies = []
+    for query_vector in queries:
+        start = time.perf_counter()
+        fn(query_vector)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, [50, 99])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=1_000_000)
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic documents")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((256, settings.embedding_dim), dtype=np.float32)
+    crud.init_db()
+    with db_context() as db:
+        document_ids = [document.id for document in db.query(Document.id).filter(Document.tags.any(TAG))]
+        if not document_ids:
+            document_ids = load(db, args.chunks, args.documents, centers, rng)
+
+        queries = clustered_vectors(args.queries, centers, rng)
+
+        cases = {
+            "corpus": lambda q: (crud.search_corpus(db, q, args.k), db.rollback()),
+            "1 document": lambda q: (crud.search_corpus(db, q, args.k, document_ids=[document_ids[0]]), db.rollback()),
+            "50 documents": lambda q: (crud.search_corpus(db, q, args.k, document_ids=document_ids[:50]), db.rollback()),
+            f"tag {HOT_TAG}": lambda q: (crud.search_corpus(db, q, args.k, tag=HOT_TAG), db.rollback()),
+        }
+        for name, fn in cases.items():
+            p50, p99 = percentiles(fn, queries)
+            print(f"{name:15s} p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  {'OK' if p99 < 100 else 'OVER 100 ms'}")
+
+        if not args.keep:
+            for document_id in document_ids:
+                crud.delete_chunks_by_document_id(db, document_id)
+                crud.delete_document(db, document_id)
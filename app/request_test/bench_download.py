@@ -0,0 +1,102 @@
+"""Benchmark: streaming download of large files from a local HTTP server.
+
+Serves a generated file with ETag and Last-Modified validators from a thread of this process, then
+measures app/pdf/download.py: throughput and peak traced memory of the first download (which should
+stay around `download_chunk_size` whatever the file size), the conditional re-download (a 304),
+and the rejection of a file larger than `download_max_bytes`.
+
+The behaviour itself is asserted by tests/test_download.py.
+
+Usage:
+    python3 -m app.request_test.bench_download --size-mb 500 --repeat 3
+"""
+
+import argparse
+import email.utils
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.pdf.download import DownloadRejected, close_http_client, download_document
+from app.settings import settings
+
+
+def make_handler(file_path, etag, last_modified):
+    class FileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == etag or self.headers.get("If-Modified-Since") == last_modified:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(os.path.getsize(file_path)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            with open(file_path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile, 1024 * 1024)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FileHandler
+
+
+def generate_file(file_path, size_mb):
+    block = os.urandom(1024 * 1024)
+    with open(file_path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+    return f'"{hashlib.sha256(block).hexdigest()[:16]}-{size_mb}"'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, "large.pdf")
+        etag = generate_file(source, args.size_mb)
+        last_modified = email.utils.formatdate(os.path.getmtime(source), usegmt=True)
+        settings.pdfs_data_dir = os.path.join(tmp_dir, "pdfs")
+        settings.download_max_bytes = (args.size_mb + 1) * 1024 * 1024
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(source, etag, last_modified))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/large.pdf"
+
+        for _ in range(args.repeat):
+            tracemalloc.start()
+            start = time.perf_counter()
+            fetched = download_document(url)
+            assert fetched is not None, "the first download of a url is never conditional"
+            download = fetched
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            os.remove(download.file_path)
+            print(f"download: {args.size_mb / elapsed:8.1f} MB/s  {elapsed * 1000:8.1f} ms  peak traced memory {peak / 1e6:6.2f} MB")
+
+        start = time.perf_counter()
+        not_modified = download_document(url, etag=download.etag, last_modified=download.last_modified)
+        print(f"conditional: {'304' if not_modified is None else 'downloaded again'} in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        settings.download_max_bytes = args.size_mb * 1024 * 1024 // 2
+        start = time.perf_counter()
+        try:
+            download_document(url)
+            print("size limit: not enforced")
+        except DownloadRejected as e:
+            print(f"size limit: rejected in {(time.perf_counter() - start) * 1000:.1f} ms ({e})")
+        print(f"leftover files: {os.listdir(settings.pdfs_data_dir)}")
+
+        close_http_client()
+        server.shutdown()
@@ -0,0 +1,55 @@
+"""Benchmark: per-chunk pipeline calls vs the batched EmbeddingService.
+
+Usage:
+    python3 -m app.request_test.bench_embedding --chunks 512 --batch-size 32
+"""
+
+import argparse
+import random
+import time
+
+from transformers import pipeline
+
+from app.huggingface.embedding import EmbeddingService
+from app.settings import settings
+
+WORDS = "the report covers revenue growth operating margin guidance capital expenditure segment results outlook risk liquidity".split()
+
+
+def make_chunks(count, seed=0):
+    """Synthetic chunks of 20-100 words, like the tail and body chunks of real pages."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 100))) for _ in range(count)]
+
+
+def bench_per_chunk(chunks):
+    """The previous indexing path: one feature-extraction pipeline call per chunk."""
+    embedding_model = pipeline("feature-extraction", model=settings.embedding_model_name)
+    embedding_model(chunks[0])
+    start = time.perf_counter()
+    for chunk in chunks:
+        embedding_model(chunk)
+    return len(chunks) / (time.perf_counter() - start)
+
+
+def bench_batched(chunks, batch_size):
+    embedding_service = EmbeddingService(batch_size=batch_size)
+    embedding_service.cache = None  # measure the model, not the embedding cache
+    start = time.perf_counter()
+    embedding_service.embed(chunks)
+    return len(chunks) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[8, 16, 32, 64])
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    # warm-up so that model loading is not measured
+    EmbeddingService().model_manager.get_model()
+
+    print(f"per-chunk pipeline: {bench_per_chunk(chunks):8.1f} chunks/sec")
+    for batch_size in args.batch_size:
+        print(f"batched (bs={batch_size:3d}):   {bench_batched(chunks, batch_size):8.1f} chunks/sec")
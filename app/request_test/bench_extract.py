@@ -0,0 +1,60 @@
+"""Benchmark: PDF text extraction backends and worker counts on a generated PDF.
+
+Usage:
+    python3 -m app.request_test.bench_extract --pages 300 --workers 1 2 4
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from fpdf import FPDF
+
+from app.pdf.extract import EXTRACTORS, iter_pages
+
+WORDS = "the report covers revenue growth operating margin guidance capital expenditure segment results outlook risk liquidity".split()
+
+
+def generate_pdf(file_path, pages, seed=0):
+    """Text heavy pages, roughly 500 words each."""
+    rng = random.Random(seed)
+    pdf = FPDF()
+    pdf.set_font("Arial", size=10)
+    for page in range(pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 5, f"Page {page + 1}\n" + " ".join(rng.choice(WORDS) for _ in range(500)))
+    pdf.output(file_path)
+
+
+def bench(file_path, backend, workers, pages_per_task):
+    start = time.perf_counter()
+    first_page_s = None
+    pages = 0
+    for _ in iter_pages(file_path, backend=backend, workers=workers, pages_per_task=pages_per_task):
+        if first_page_s is None:
+            first_page_s = time.perf_counter() - start
+        pages += 1
+    elapsed = time.perf_counter() - start
+    return pages / elapsed, first_page_s
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "bench.pdf")
+        generate_pdf(file_path, args.pages)
+        print(f"generated {args.pages} pages, {os.path.getsize(file_path) / 1e6:.1f} MB")
+
+        for backend in EXTRACTORS:
+            for workers in args.workers:
+                # first run warms up the process pool
+                bench(file_path, backend, workers, args.pages_per_task)
+                rate, first_page_s = bench(file_path, backend, workers, args.pages_per_task)
+                print(f"{backend:8s} workers={workers}: {rate:8.1f} pages/sec, first page after {first_page_s * 1000:7.1f} ms")
@@ -0,0 +1,54 @@
+"""Benchmark: commit-per-row insert_chunk vs bulk_insert_chunks (binary COPY).
+
+Needs a running postgres with pgvector (settings from EMB_POSTGRES_*).
+
+Usage:
+    python3 -m app.request_test.bench_insert --rows 5000 --batch-size 500 1000 5000
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.database import crud
+from app.database.session import db_context
+from app.settings import settings
+
+
+def bench_per_row(db, document_id, texts, vectors):
+    start = time.perf_counter()
+    for chunk, vector in zip(texts, vectors):
+        crud.insert_chunk(db, document_id=document_id, chunk=chunk, vector=vector)
+    return len(texts) / (time.perf_counter() - start)
+
+
+def bench_bulk(db, document_id, texts, vectors, batch_size):
+    start = time.perf_counter()
+    crud.replace_chunks(db, document_id=document_id, texts=texts, vectors=vectors, batch_size=batch_size)
+    return len(texts) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[500, 1000, 5000])
+    parser.add_argument("--per-row-rows", type=int, default=1000, help="rows for the slow per-row path")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.rows, settings.embedding_dim), dtype=np.float32)
+    texts = [f"synthetic chunk number {i} " * 20 for i in range(args.rows)]
+
+    crud.init_db()
+    with db_context() as db:
+        document_id = crud.insert_document(db, file_path="bench-insert.pdf")
+        try:
+            rate = bench_per_row(db, document_id, texts[: args.per_row_rows], vectors[: args.per_row_rows])
+            print(f"insert_chunk (commit per row): {rate:10.1f} rows/sec")
+            for batch_size in args.batch_size:
+                rate = bench_bulk(db, document_id, texts, vectors, batch_size)
+                print(f"bulk COPY (batch {batch_size:5d}):    {rate:10.1f} rows/sec")
+        finally:
+            crud.delete_chunks_by_document_id(db, document_id)
+            crud.delete_document(db, document_id)
@@ -0,0 +1,76 @@
+"""Benchmark: memory and startup time of 1, 4 and 8 model processes, memory mapped or private weights.
+
+Starts `--processes` fresh (spawned) processes per round, each loads the embedding model through the
+ModelManager and embeds one text, then reports its load time and memory while all of them are alive:
+RSS counts shared pages in every process, PSS splits them between the processes sharing them, so the
+PSS total is what the round really costs. Each round runs with EMB_EMBEDDING_MODEL_LOAD=mmap and copy,
+and EMB_EMBEDDING_NUM_THREADS set to the cores divided by the processes, like bin/run_dramatiq. Needs
+the model files locally (or network access) but no database, the embedding cache is disabled.
+
+Usage:
+    python3 -m app.request_test.bench_model_memory --processes 1 4 8 --modes mmap copy
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+MIB = 1024 * 1024
+
+
+def memory_kb() -> dict:
+    """Rss, Pss and Shared_Clean of this process in kB, from /proc/self/smaps_rollup (Linux >= 4.14)."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss", "Shared_Clean"):
+                values[key] = int(rest.split()[0])
+    return values
+
+
+def worker(barrier, results):
+    from app.huggingface.embedding import EmbeddingService
+    from app.huggingface.manager import ModelManager
+
+    start = time.perf_counter()
+    ModelManager().get_model()
+    load_s = time.perf_counter() - start
+    EmbeddingService().embed(["memory benchmark warm up"])
+    barrier.wait()  # every process is loaded, the shared pages are counted once in the PSS total
+    results.put({"load_s": load_s, **memory_kb()})
+    barrier.wait()
+
+
+def run_round(processes: int, mode: str) -> list:
+    os.environ["EMB_EMBEDDING_MODEL_LOAD"] = mode
+    os.environ["EMB_EMBEDDING_CACHE_ENABLED"] = "false"  # every process runs a forward pass
+    os.environ["EMB_EMBEDDING_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // processes))
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [context.Process(target=worker, args=(barrier, results)) for _ in range(processes)]
+    for process in workers:
+        process.start()
+    reports = [results.get() for _ in range(processes)]
+    for process in workers:
+        process.join()
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--modes", nargs="+", default=["mmap", "copy"], choices=["mmap", "copy"])
+    args = parser.parse_args()
+
+    print(f"{'mode':>5} {'procs':>5} {'load mean':>10} {'load max':>9} {'RSS total':>10} {'PSS total':>10} {'shared/proc':>12}")
+    for processes in args.processes:
+        for mode in args.modes:
+            reports = run_round(processes, mode)
+            loads = [report["load_s"] for report in reports]
+            rss = sum(report["Rss"] for report in reports) * 1024 / MIB
+            pss = sum(report["Pss"] for report in reports) * 1024 / MIB
+            shared = sum(report["Shared_Clean"] for report in reports) * 1024 / MIB / processes
+            print(f"{mode:>5} {processes:>5} {sum(loads) / processes:>9.2f}s {max(loads):>8.2f}s " f"{rss:>7.0f} MiB {pss:>7.0f} MiB {shared:>8.0f} MiB")
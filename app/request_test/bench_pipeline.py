@@ -0,0 +1,278 @@
+"""End-to-end benchmark of indexing and /qa/, offline and reproducible, with JSON output for regression tracking.
+
+Synthetic PDFs are generated with fpdf and embedded by the deterministic FakeBackend (see fakes.py),
+so no model is downloaded and results only move when the code does.
+
+--database postgres runs the real document state machine of app/tasks/document.py against the configured
+postgres (EMB_POSTGRES_*), with every actor executed in this process in message order, then measures
+/qa/ latency through app/api/qa.py in-process. --database memory needs no services: it runs extraction,
+chunking and embedding with the same components and searches a NumPy matrix instead of postgres.
+--redis memory replaces redis with an in-memory stand-in. Point --database postgres at a scratch database,
+the fake vectors are stored like real ones while the benchmark runs.
+
+Every stage reports its wall time and its peak of traced Python/NumPy allocations (tracemalloc slows
+down allocation heavy stages a little, compare runs made with the same flags).
+
+Usage:
+    python3 -m app.request_test.bench_pipeline --database memory --documents 4 --pages 50 --output bench.json
+    python3 -m app.request_test.bench_pipeline --database postgres --redis local --documents 8 --pages 100 --clients 16
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.request_test.bench_extract import WORDS, generate_pdf
+from app.request_test.fakes import install_fake_model, install_fake_redis, word_length_function
+from app.settings import settings
+
+
+class StageStats:
+    """Wall time, calls and peak traced memory per pipeline stage."""
+
+    def __init__(self):
+        self.stages = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "peak_mb": 0.0})
+
+    @contextmanager
+    def measure(self, name):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages[name]
+            stage["calls"] += 1
+            stage["seconds"] += time.perf_counter() - start
+            stage["peak_mb"] = max(stage["peak_mb"], (tracemalloc.get_traced_memory()[1] - base) / 1e6)
+
+    def to_dict(self):
+        return {name: {**stage, "seconds": round(stage["seconds"], 4), "peak_mb": round(stage["peak_mb"], 2)} for name, stage in self.stages.items()}
+
+
+def percentiles(latencies_ms):
+    if not latencies_ms:
+        return {}
+    p50, p90, p99 = np.percentile(latencies_ms, [50, 90, 99])
+    return {"count": len(latencies_ms), "mean_ms": float(np.mean(latencies_ms)), "p50_ms": float(p50), "p90_ms": float(p90), "p99_ms": float(p99)}
+
+
+def make_queries(count, seed=1):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8))) for _ in range(count)]
+
+
+def run_memory(pdfs, queries, stats):
+    """Extraction, chunking and embedding with the production components, search on a NumPy matrix."""
+    from app.huggingface.embedding import EmbeddingService
+    from app.pdf.chunker import RecursiveChunker
+    from app.pdf.extract import iter_pages
+    from app.retrieval.memory_index import top_k
+
+    chunker = RecursiveChunker(length_function=word_length_function)
+    embedding_service = EmbeddingService()
+    documents = []
+    for file_path in pdfs:
+        with stats.measure("extract"):
+            pages = list(iter_pages(file_path))
+        with stats.measure("chunk"):
+            chunks = list(chunker.chunk_pages(pages))
+        with stats.measure("embed"):
+            vectors = embedding_service.embed([chunk.text for chunk in chunks])
+        with stats.measure("store"):
+            documents.append((np.ascontiguousarray(vectors), [chunk.text for chunk in chunks]))
+
+    latencies = []
+    for i, query in enumerate(queries):
+        vectors, texts = documents[i % len(documents)]
+        start = time.perf_counter()
+        query_vector = embedding_service.embed([query])[0]
+        positions, _ = top_k(vectors, query_vector, settings.qa_top_k)
+        relevant_chunks = [texts[position] for position in positions]  # noqa: F841
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, sum(len(texts) for _, texts in documents)
+
+
+class InlineBroker:
+    """Runs the document state machine in this process: messages are queued and executed in order, each one timed."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.messages = deque()
+
+    def install(self):
+        from app.tasks import document as tasks
+
+        tasks.move_document_forward = self.move_document_forward
+        tasks.send_shards = self.send_shards
+
+    def move_document_forward(self, document_id, event, **kwargs):
+        from app.database import crud
+        from app.database.session import db_context
+        from app.tasks.document import document_state_mapping
+
+        with db_context() as db_session:
+            status = crud.get_document(db_session, document_id).status
+        next_task = document_state_mapping()[status].get(event)
+        if next_task:
+            self.messages.append((next_task, (), {"document_id": document_id, **kwargs}))
+
+    def send_shards(self, document_id, page_count):
+        from app.tasks.document import extract_page_range, finish_extraction
+        from app.tasks.progress import start_progress
+
+        start_progress(document_id, page_count)
+        for start in range(0, page_count, settings.index_shard_pages):
+            self.messages.append((extract_page_range, (document_id, start, min(start + settings.index_shard_pages, page_count)), {}))
+        self.messages.append((finish_extraction, (document_id,), {}))
+
+    def run(self):
+        while self.messages:
+            actor, args, kwargs = self.messages.popleft()
+            with self.stats.measure(actor.actor_name):
+                actor(*args, **kwargs)
+
+
+async def measure_qa(urls, queries, clients):
+    import httpx
+
+    from app.main import app
+
+    latencies, errors = [], 0
+
+    async def client_loop(client, payloads):
+        nonlocal errors
+        for payload in payloads:
+            start = time.perf_counter()
+            response = await client.post("/qa/", json=payload)
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    payloads = [{"url": urls[i % len(urls)], "query": query} for i, query in enumerate(queries)]
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        await client_loop(client, payloads[:clients])  # warm-up
+        latencies.clear()
+        await asyncio.gather(*(client_loop(client, payloads[i::clients]) for i in range(clients)))
+    return latencies, errors
+
+
+def run_postgres(pdfs, queries, stats, clients):
+    """The real pipeline: actors of app/tasks/document.py in message order, then /qa/ through the API."""
+    from app.database import crud
+    from app.database.session import db_context
+    from app.models.document import DocumentEventsEnum, DocumentStatusEnum
+    from app.pdf.chunker import RecursiveChunker
+    from app.tasks import document as tasks
+
+    tasks.chunker = RecursiveChunker(length_function=word_length_function)
+    broker = InlineBroker(stats)
+    broker.install()
+    crud.init_db()
+
+    run_id = f"{os.getpid()}-{int(time.time())}"
+    document_ids, urls = [], []
+    with db_context() as db_session:
+        for i, file_path in enumerate(pdfs):
+            url = f"bench://{run_id}/{i}.pdf"
+            document_ids.append(crud.insert_document(db_session, file_path=file_path, url=url))
+            urls.append(url)
+
+    for document_id in document_ids:
+        broker.move_document_forward(document_id, DocumentEventsEnum.LOAD_REQUEST.value, download=False)
+        broker.run()
+
+    with db_context() as db_session:
+        failed = [document_id for document_id in document_ids if crud.get_document(db_session, document_id).status != DocumentStatusEnum.INDEXED]
+        chunks = sum(len(crud.get_chunks(db_session, document_id)) for document_id in document_ids)
+    if failed:
+        raise RuntimeError(f"Documents not indexed: {failed}")
+
+    latencies, errors = asyncio.run(measure_qa(urls, queries, clients))
+    if errors:
+        print(f"{errors} /qa/ requests failed", file=sys.stderr)
+
+    with db_context() as db_session:
+        for document_id in document_ids:
+            crud.delete_chunks_by_document_id(db_session, document_id)
+            crud.delete_document(db_session, document_id)
+    return latencies, chunks
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", choices=["memory", "postgres"], default="memory")
+    parser.add_argument("--redis", choices=["memory", "local"], default="memory")
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=8, help="concurrent /qa/ clients (postgres only)")
+    parser.add_argument("--layers", type=int, default=2, help="dense layers per fake forward pass")
+    parser.add_argument("--output", help="JSON file, printed to stdout when omitted")
+    args = parser.parse_args()
+
+    install_fake_model(layers=args.layers)
+    if args.redis == "memory":
+        install_fake_redis()
+    stats = StageStats()
+    queries = make_queries(args.queries)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdfs = []
+        for i in range(args.documents):
+            pdfs.append(os.path.join(tmp_dir, f"bench-{i}.pdf"))
+            generate_pdf(pdfs[-1], args.pages, seed=i)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        if args.database == "memory":
+            latencies, chunks = run_memory(pdfs, queries, stats)
+        else:
+            latencies, chunks = run_postgres(pdfs, queries, stats, args.clients)
+        total_s = time.perf_counter() - start
+        tracemalloc.stop()
+
+    stages = stats.to_dict()
+    indexing_s = sum(stage["seconds"] for stage in stages.values())
+    pages = args.documents * args.pages
+    result = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "config": {**vars(args), "embedding_dim": settings.embedding_dim, "chunk_size": settings.chunk_size, "index_shard_pages": settings.index_shard_pages},
+        "indexing": {
+            "pages": pages,
+            "chunks": chunks,
+            "seconds": round(indexing_s, 4),
+            "pages_per_s": round(pages / indexing_s, 2) if indexing_s else None,
+            "chunks_per_s": round(chunks / indexing_s, 2) if indexing_s else None,
+        },
+        "qa": percentiles(latencies),
+        "stages": stages,
+        "total_s": round(total_s, 4),
+    }
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
@@ -0,0 +1,66 @@
+"""Benchmark: recall@k, latency and bytes per vector of compact vector codes with exact rescoring.
+
+Synthetic clustered unit vectors are searched exactly in float32 (the ground truth), then through the
+coarse codes of app/retrieval/quantization.py (float16 like pgvector halfvec, int8, binary like bit
+vectors with Hamming distance), each followed by exact rescoring of the top `depth` candidates.
+Pick the cheapest precision and depth reaching the recall a deployment needs, then set
+`vector_index_precision` / `memory_index_precision` and `vector_rescore_depth`.
+
+Usage:
+    python3 -m app.request_test.bench_quantization --vectors 200000 --queries 200 --k 5 --depths 20 100 400
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from app.retrieval.quantization import PRECISIONS, bytes_per_vector, coarse_scores, encode, top_n
+from app.settings import settings
+
+
+def clustered_unit_vectors(count, dim, clusters, noise, rng):
+    """Embeddings are not uniform on the sphere: points around random topic centers."""
+    centers = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + noise * rng.standard_normal((count, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def search(vectors, codes, precision, query_vector, k, depth):
+    if precision == "float32":
+        return top_n(vectors @ query_vector, k)
+    candidates = top_n(coarse_scores(codes, query_vector, precision), max(k, depth))
+    return candidates[top_n(vectors[candidates] @ query_vector, k)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=settings.embedding_dim)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--noise", type=float, default=1.0, help="spread around the cluster centers, relative to their norm")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=settings.qa_top_k)
+    parser.add_argument("--depths", type=int, nargs="+", default=[20, 100, 400], help="candidates rescored per query")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = clustered_unit_vectors(args.vectors, args.dim, args.clusters, args.noise, rng)
+    queries = vectors[rng.integers(0, args.vectors, args.queries)] + 0.5 * args.noise * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = [set(top_n(vectors @ query_vector, args.k).tolist()) for query_vector in queries]
+
+    print(f"{args.vectors} vectors of {args.dim} dims, {args.queries} queries, recall@{args.k}")
+    print(f"{'precision':>10} {'depth':>6} {'bytes/vec':>10} {'index MB':>9} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for precision in PRECISIONS:
+        codes = encode(vectors, precision)
+        for depth in [args.k] if precision == "float32" else args.depths:
+            latencies, found = [], 0
+            for query_vector, expected in zip(queries, truth):
+                start = time.perf_counter()
+                result = search(vectors, codes, precision, query_vector, args.k, depth)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found += len(expected.intersection(result.tolist()))
+            p50, p99 = np.percentile(latencies, [50, 99])
+            size = bytes_per_vector(args.dim, precision)
+            print(f"{precision:>10} {depth:>6} {size:>10} {size * args.vectors / 1e6:>9.1f} " f"{found / (args.k * args.queries):>7.3f} {p50:>8.2f} {p99:>8.2f}")
@@ -0,0 +1,86 @@
+"""Benchmark: python-side similarity loop vs pgvector top-k search.
+
+Needs a running postgres with pgvector (settings from EMB_POSTGRES_*). Synthetic documents are
+inserted, queried and deleted again.
+
+Usage:
+    python3 -m app.request_test.bench_search --sizes 1000 10000 100000 --queries 20
+"""
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from sqlalchemy import insert
+
+from app.database import crud
+from app.database.models import ChunkEmbedding
+from app.database.session import db_context
+from app.settings import settings
+
+
+def random_unit_vectors(count, rng):
+    vectors = rng.standard_normal((count, settings.embedding_dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def create_document(db, size, rng, batch_size=5000):
+    document_id = crud.insert_document(db, file_path=f"bench-{size}.pdf")
+    for start in range(0, size, batch_size):
+        vectors = random_unit_vectors(min(batch_size, size - start), rng)
+        rows = [{"document_id": document_id, "text": f"chunk {start + i}", "vector": vector} for i, vector in enumerate(vectors)]
+        db.execute(insert(ChunkEmbedding), rows)
+        db.commit()
+    return document_id
+
+
+def python_top_k(db, document_id, query_vector, k):
+    """The previous /qa/ path: stream every chunk and score it in python."""
+    similarities = []
+    for chunk in crud.get_chunks_individually(db, document_id=document_id):
+        chunk_vector = np.asarray(chunk.vector, dtype=np.float32)
+        similarities.append((chunk.text, cosine_similarity(query_vector.reshape(1, -1), chunk_vector.reshape(1, -1))[0][0]))
+    similarities.sort(key=lambda x: x[1], reverse=True)
+    return [text for text, _ in similarities[:k]]
+
+
+def pgvector_top_k(db, document_id, query_vector, k):
+    return [chunk.text for chunk in crud.search_chunks(db, document_id=document_id, query_vector=query_vector, k=k)]
+
+
+def timed(fn, db, document_id, queries, k):
+    latencies, results = [], []
+    for query_vector in queries:
+        start = time.perf_counter()
+        results.append(fn(db, document_id, query_vector, k))
+        db.rollback()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, [50, 99]), results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=settings.qa_top_k)
+    parser.add_argument("--skip-python", action="store_true", help="skip the slow python path for the largest sizes")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    crud.init_db()
+    with db_context() as db:
+        for size in args.sizes:
+            document_id = create_document(db, size, rng)
+            queries = random_unit_vectors(args.queries, rng)
+            try:
+                (p50, p99), ann = timed(pgvector_top_k, db, document_id, queries, args.k)
+                line = f"{size:>7d} chunks | pgvector p50 {p50:8.1f} ms p99 {p99:8.1f} ms"
+                if not args.skip_python:
+                    (py50, py99), exact = timed(python_top_k, db, document_id, queries, args.k)
+                    recall = np.mean([len(set(a) & set(e)) / len(e) for a, e in zip(ann, exact)])
+                    line += f" | python p50 {py50:8.1f} ms p99 {py99:8.1f} ms | recall@{args.k} {recall:.3f}"
+                print(line)
+            finally:
+                crud.delete_chunks_by_document_id(db, document_id)
+                crud.delete_document(db, document_id)
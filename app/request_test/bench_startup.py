@@ -0,0 +1,70 @@
+"""Startup measurements and import-time budget.
+
+Measures, in fresh interpreters, how long `import app.main` takes, then starts uvicorn and measures
+the time until /ping answers (serving) and until /ready answers 200 (model loaded, database up).
+Exits with status 1 when the median import time exceeds --import-budget-s, so it can run in CI
+to catch modules that load the model or talk to the database at import time.
+tests/test_startup.py runs the import budget in the test suite (.github/workflows/test.yaml).
+
+Usage:
+    python3 -m app.request_test.bench_startup --import-budget-s 5
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+PORT = 8011
+
+
+def measure_import(runs):
+    code = "import time; start = time.perf_counter(); import app.main; print(time.perf_counter() - start)"
+    return [float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+
+
+def wait_for(url, timeout_s, expected_status=200):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == expected_status:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def measure_server(timeout_s):
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ping_s = time.perf_counter() - start if wait_for(f"http://localhost:{PORT}/ping", timeout_s) else None
+        ready_s = time.perf_counter() - start if wait_for(f"http://localhost:{PORT}/ready", timeout_s) else None
+        return ping_s, ready_s
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget-s", type=float, default=5.0)
+    parser.add_argument("--server-timeout-s", type=float, default=300.0)
+    parser.add_argument("--skip-server", action="store_true")
+    args = parser.parse_args()
+
+    import_times = measure_import(args.runs)
+    median = statistics.median(import_times)
+    print(f"import app.main: median {median:.2f} s, max {max(import_times):.2f} s over {args.runs} runs (budget {args.import_budget_s:.2f} s)")
+
+    if not args.skip_server:
+        ping_s, ready_s = measure_server(args.server_timeout_s)
+        print(f"uvicorn start -> /ping 200: {ping_s if ping_s is None else f'{ping_s:.2f} s'}")
+        print(f"uvicorn start -> /ready 200: {ready_s if ready_s is None else f'{ready_s:.2f} s'}")
+
+    sys.exit(1 if median > args.import_budget_s else 0)
@@ -0,0 +1,172 @@
+"""Offline stand-ins for the embedding model and redis, used by the benchmarks.
+
+FakeBackend has the interface of the inference backends (a tokenizer, `hidden_size` and `forward`), so
+EmbeddingService, the batcher and the API run unchanged on top of it without downloading a model:
+`install_fake_model()` puts it into the ModelManager singleton. Embeddings are deterministic, texts
+sharing words get similar vectors, and `layers` dense layers per forward pass give it a real CPU cost.
+"""
+
+import hashlib
+from collections import defaultdict
+from typing import Optional, cast
+
+import redis
+import torch
+
+from app.huggingface.manager import ModelManager
+from app.settings import settings
+
+VOCAB_SIZE = 30000
+CLS_ID, SEP_ID, PAD_ID = 1, 2, 0
+
+
+class FakeTokenizer:
+    """Whitespace tokenizer with hashed word ids, same call and pad signatures as the Hugging Face tokenizers."""
+
+    def _ids(self, text: str) -> list[int]:
+        return [3 + int.from_bytes(hashlib.blake2b(word.lower().encode(), digest_size=4).digest(), "little") % (VOCAB_SIZE - 3) for word in text.split()]
+
+    def __call__(self, texts, truncation=False, max_length=None, add_special_tokens=True, verbose=True, return_tensors=None):
+        input_ids = []
+        for text in [texts] if isinstance(texts, str) else texts:
+            ids = self._ids(text)
+            if add_special_tokens:
+                ids = [CLS_ID, *ids[: max_length - 2]] + [SEP_ID] if truncation and max_length else [CLS_ID, *ids, SEP_ID]
+            elif truncation and max_length:
+                ids = ids[:max_length]
+            input_ids.append(ids)
+        features = {"input_ids": input_ids, "attention_mask": [[1] * len(ids) for ids in input_ids]}
+        return self.pad(features, return_tensors=return_tensors) if return_tensors else features
+
+    def pad(self, features: dict, return_tensors=None) -> dict:
+        width = max(len(ids) for ids in features["input_ids"])
+        padded = {key: [list(row) + [PAD_ID] * (width - len(row)) for row in rows] for key, rows in features.items()}
+        return {key: torch.tensor(rows) for key, rows in padded.items()} if return_tensors == "pt" else padded
+
+
+class FakeBackend:
+    """
+    Deterministic embedding backend: every token position holds the mean of the word vectors of its text.
+
+    Methods:
+        - forward(features): Returns (batch, tokens, hidden_size) token states.
+    """
+
+    name = "fake"
+
+    def __init__(self, hidden_size: Optional[int] = None, layers: int = 2, seed: int = 0):
+        self.tokenizer = FakeTokenizer()
+        self.hidden_size = hidden_size or settings.embedding_dim
+        generator = torch.Generator().manual_seed(seed)
+        self.word_vectors = torch.randn(VOCAB_SIZE, self.hidden_size, generator=generator)
+        self.layers = [torch.randn(self.hidden_size, self.hidden_size, generator=generator) / self.hidden_size**0.5 for _ in range(layers)]
+
+    def forward(self, features: dict) -> torch.Tensor:
+        mask = features["attention_mask"].unsqueeze(-1).float()
+        states = self.word_vectors[features["input_ids"]] * mask
+        for weight in self.layers:
+            states = states + torch.tanh(states @ weight)  # padding stays zero
+        pooled = states.sum(dim=1, keepdim=True) / mask.sum(dim=1, keepdim=True).clamp(min=1)
+        return pooled.expand(-1, states.shape[1], -1)
+
+
+def word_length_function(texts: list[str]) -> list[int]:
+    """Chunker length function counting FakeTokenizer tokens."""
+    return [len(text.split()) for text in texts]
+
+
+def install_fake_model(layers: int = 2) -> FakeBackend:
+    """Make every ModelManager in this process return a FakeBackend.
+
+    Call it before EmbeddingServices are created: the model name is part of their cache namespace,
+    renaming it keeps fake vectors apart from the real model's in a shared redis.
+    """
+    backend = FakeBackend(layers=layers)
+    settings.embedding_model_name = f"fake-{layers}"
+    ModelManager().model = backend
+    return backend
+
+
+class FakeRedis:
+    """In-memory subset of the redis-py client used by the caches and the progress tracking."""
+
+    def __init__(self):
+        self.data = {}
+        self.hashes = defaultdict(dict)
+
+    @staticmethod
+    def _bytes(value) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, **kwargs):
+        self.data[key] = self._bytes(value)
+
+    def setex(self, key, ttl, value):
+        self.data[key] = self._bytes(value)
+
+    def hset(self, key, field, value):
+        self.hashes[key][self._bytes(field)] = self._bytes(value)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.hashes.pop(key, None)
+
+    def expire(self, key, ttl):
+        return True
+
+    def config_set(self, name, value):
+        return True
+
+    def ping(self):
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self.calls: list[tuple] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((getattr(self.client, name), args, kwargs))
+            return self
+
+        return call
+
+    def execute(self):
+        results = [method(*args, **kwargs) for method, args, kwargs in self.calls]
+        self.calls = []
+        return results
+
+
+def install_fake_redis() -> FakeRedis:
+    """Point the embedding cache, the /qa/ result cache and the indexing progress at an in-memory redis."""
+    from app.huggingface.cache import embedding_cache
+    from app.retrieval.result_cache import result_cache
+    from app.tasks import progress
+
+    client = FakeRedis()
+    redis_client = cast(redis.Redis, client)
+    embedding_cache.redis_client = redis_client
+    result_cache.redis_client = redis_client
+    progress.redis_conn = redis_client
+    return client
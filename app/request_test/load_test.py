@@ -0,0 +1,64 @@
+"""Load test: p50/p99 latency of /qa/ (and of /ping next to it) under concurrent clients.
+
+Run it against the API before and after a change, /ping latency shows how much the event loop is blocked.
+
+Usage:
+    python3 -m app.request_test.load_test --url https://s29.q4cdn.com/175625835/files/doc_downloads/test.pdf --clients 50 --requests 20
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+BASE_URL = "http://localhost:8001"
+QUERIES = [
+    "What is the main topic of the document?",
+    "What are the key financial results?",
+    "Which risks are mentioned?",
+    "What is the outlook for next year?",
+]
+
+
+async def client_loop(client, path, payloads, latencies, errors):
+    for payload in payloads:
+        start = time.perf_counter()
+        try:
+            response = await client.post(path, json=payload) if payload is not None else await client.get(path)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - start) * 1000)
+        except httpx.HTTPError:
+            errors.append(payload)
+
+
+async def run(base_url, document_url, clients, requests_per_client):
+    qa_latencies, ping_latencies, errors = [], [], []
+    limits = httpx.Limits(max_connections=clients + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        qa_clients = [
+            client_loop(client, "/qa/", [{"url": document_url, "query": QUERIES[(c + i) % len(QUERIES)]} for i in range(requests_per_client)], qa_latencies, errors)
+            for c in range(clients)
+        ]
+        ping_client = client_loop(client, "/ping", [None] * requests_per_client, ping_latencies, errors)
+
+        start = time.perf_counter()
+        await asyncio.gather(ping_client, *qa_clients)
+        elapsed = time.perf_counter() - start
+
+    for name, latencies in (("/qa/", qa_latencies), ("/ping", ping_latencies)):
+        if latencies:
+            p50, p99 = np.percentile(latencies, [50, 99])
+            print(f"{name:6s} n={len(latencies):5d} p50 {p50:9.1f} ms  p99 {p99:9.1f} ms")
+    print(f"throughput {len(qa_latencies) / elapsed:.1f} qa/s, errors {len(errors)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--url", required=True, help="URL of an already indexed document")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.url, args.clients, args.requests))
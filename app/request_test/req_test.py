@@ -12,7 +12,7 @@ PDF_URL = "https://s29.q4cdn.com/175625835/files/doc_downloads/test.pdf"
 def upload_document(pdf_url):
     upload_endpoint = f"{BASE_URL}/upload/"
     response = requests.post(upload_endpoint, json={"url": pdf_url})
-    if response.status_code == 200:
+    if response.status_code == 202:
         data = response.json()
         print(f"Document uploaded successfully: {data}")
         return data["document_id"]
@@ -0,0 +1 @@
+"""Retrieval tiers in front of the postgres vector search."""
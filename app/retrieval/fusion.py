@@ -0,0 +1,81 @@
+import asyncio
+from typing import Any, Callable, Optional, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.database import crud
+from app.database.session import db_context
+from app.retrieval.memory_index import SearchRow
+from app.settings import settings
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence], weights: Sequence[float], k: int, rrf_k: Optional[int] = None) -> list:
+    """Merge ranked result lists: a row scores sum(weight / (rrf_k + rank)) over the lists it appears in.
+
+    Args:
+        rankings: lists of rows with an `id`, best first.
+        weights: weight of each list.
+        k: number of rows to return.
+        rrf_k: rank offset, larger values flatten the gap between the first ranks.
+
+    Returns:
+        list: SearchRow items best first, `score` is the fused score.
+    """
+    rrf_k = settings.hybrid_rrf_k if rrf_k is None else rrf_k
+    rows: dict[int, Any] = {}
+    scores: dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, row in enumerate(ranking, start=1):
+            rows.setdefault(row.id, row)
+            scores[row.id] = scores.get(row.id, 0.0) + weight / (rrf_k + rank)
+
+    best = sorted(scores, key=lambda chunk_id: (-scores[chunk_id], chunk_id))[:k]
+    return [SearchRow(row.id, row.document_id, row.page_start, row.page_end, row.text, scores[row.id]) for row in (rows[chunk_id] for chunk_id in best)]
+
+
+def _in_session(search: Callable, *args, **kwargs) -> list:
+    """Run one search leg in its own session, so both legs can run at the same time."""
+    with db_context() as db:
+        return search(db, *args, **kwargs)
+
+
+async def hybrid_search(
+    query_text: str,
+    query_vector,
+    k: int,
+    candidate_depth: Optional[int] = None,
+    vector_weight: Optional[float] = None,
+    lexical_weight: Optional[float] = None,
+    document_ids: Optional[Sequence[int]] = None,
+    tag: Optional[str] = None,
+    score_threshold: Optional[float] = None,
+) -> list:
+    """Full-text and vector top-k queries run concurrently in postgres, merged with reciprocal rank fusion.
+
+    Each leg returns at most `candidate_depth` rows from its index, so the cost is bounded by the
+    depth and not by the size of the corpus.
+
+    Args:
+        query_text: query for the full-text leg.
+        query_vector: query embedding for the vector leg.
+        k: number of chunks.
+        candidate_depth: rows fetched by each leg.
+        vector_weight: fusion weight of the vector leg.
+        lexical_weight: fusion weight of the full-text leg.
+        document_ids: restrict to these documents.
+        tag: restrict to documents with this tag.
+        score_threshold: minimum cosine similarity of vector candidates.
+
+    Returns:
+        list: SearchRow items best first.
+    """
+    candidate_depth = max(k, candidate_depth or settings.hybrid_candidate_depth)
+    weights = [
+        settings.hybrid_vector_weight if vector_weight is None else vector_weight,
+        settings.hybrid_lexical_weight if lexical_weight is None else lexical_weight,
+    ]
+    rankings = await asyncio.gather(
+        run_in_threadpool(_in_session, crud.search_corpus, query_vector, candidate_depth, document_ids=document_ids, tag=tag, score_threshold=score_threshold),
+        run_in_threadpool(_in_session, crud.search_text, query_text, candidate_depth, document_ids=document_ids, tag=tag),
+    )
+    return reciprocal_rank_fusion(rankings, weights, k)
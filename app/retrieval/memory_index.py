@@ -0,0 +1,234 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from app.database import DBSession, crud
+from app.metrics import memory_index_lookups
+from app.retrieval.quantization import PRECISIONS, check_precision, coarse_scores, encode, top_n
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SearchRow(NamedTuple):
+    """Same fields as the rows of crud.search_corpus."""
+
+    id: int
+    document_id: int
+    page_start: Optional[int]
+    page_end: Optional[int]
+    text: str
+    score: float
+
+
+class DocumentIndex(NamedTuple):
+    """Memory mapped snapshot of one document: chunk ids and the codes of their unit-norm vectors."""
+
+    ids: np.ndarray
+    vectors: np.ndarray  # float32, or the compact codes of `memory_index_precision`
+    signature: tuple  # (inode, mtime) of the vectors file when it was mapped
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.vectors.nbytes
+
+
+def top_k(vectors: np.ndarray, query_vector: np.ndarray, k: int) -> tuple:
+    """Return the row positions and scores of the k best rows, best first (one matmul and a partial sort)."""
+    scores = vectors @ query_vector
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best])]
+    return best, scores[best]
+
+
+class MemoryIndex:
+    """
+    In-process vector index of the most queried documents.
+
+    Every document gets one contiguous matrix, written once as `.npy` into `memory_index_dir` and
+    opened with `mmap_mode="r"`, so all workers of a host share the pages through the OS page cache.
+    Mapped documents are dropped least recently used first once they exceed `max_bytes`.
+
+    With a compact `precision` (float16, int8 or binary, see quantization.py) the matrix holds codes:
+    the top `vector_rescore_depth` candidates are rescored on their float32 vectors read from postgres.
+
+    Snapshots are deleted by `invalidate` when a document is deleted or re-indexed. Other processes notice
+    because the file they mapped is gone or replaced, and a snapshot pointing at chunk ids that no longer
+    exist is dropped on the spot, so a stale snapshot never answers a query.
+
+    Methods:
+        - search(db, document_id, query_vector, k): Returns the top k rows, or None when postgres has to answer.
+        - invalidate(document_id): Drops the document from this process and deletes its snapshot.
+        - stats(): Returns mapped documents, bytes and hit/miss counters.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: Optional[int] = None, min_queries: Optional[int] = None, precision: Optional[str] = None):
+        self.directory = directory or settings.memory_index_dir
+        self.precision = precision or settings.memory_index_precision
+        check_precision(self.precision)
+        self.max_bytes = max_bytes or settings.memory_index_max_bytes
+        self.min_queries = settings.memory_index_min_queries if min_queries is None else min_queries
+        self._indexes: OrderedDict = OrderedDict()
+        self._query_counts: dict = {}
+        self._building: set = set()  # documents whose snapshot this process is writing
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+
+    def _paths(self, document_id: int) -> tuple:
+        return os.path.join(self.directory, f"{document_id}.ids.npy"), os.path.join(self.directory, f"{document_id}.{self.precision}.npy")
+
+    def _build(self, db: DBSession, document_id: int) -> None:
+        """Write the snapshot of a document from postgres, ids first and the vectors file last."""
+        ids, vectors = crud.get_chunk_vectors(db, document_id)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        os.makedirs(self.directory, exist_ok=True)
+        for path, array in zip(self._paths(document_id), (ids, encode(vectors, self.precision))):
+            tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+        self.builds += 1
+        logger.info(f"Memory index snapshot of document {document_id}: {len(ids)} {self.precision} chunks")
+
+    def _open(self, document_id: int) -> Optional[DocumentIndex]:
+        ids_path, vectors_path = self._paths(document_id)
+        try:
+            stat = os.stat(vectors_path)
+            ids = np.load(ids_path, mmap_mode="r")
+            vectors = np.load(vectors_path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+        if len(ids) != len(vectors):  # caught between the two renames of a rebuild
+            return None
+        return DocumentIndex(ids, vectors, (stat.st_ino, stat.st_mtime_ns))
+
+    def _is_current(self, document_id: int, index: DocumentIndex) -> bool:
+        try:
+            stat = os.stat(self._paths(document_id)[1])
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) == index.signature
+
+    def _get(self, db: DBSession, document_id: int) -> Optional[DocumentIndex]:
+        with self._lock:
+            index = self._indexes.get(document_id)
+            if index is not None:
+                if self._is_current(document_id, index):
+                    self._indexes.move_to_end(document_id)
+                    return index
+                self._drop(document_id)
+
+            index = self._open(document_id)
+            if index is None:
+                self._query_counts[document_id] = self._query_counts.get(document_id, 0) + 1
+                if self._query_counts[document_id] < self.min_queries or document_id in self._building:
+                    return None
+                self._building.add(document_id)
+
+        if index is None:
+            # outside the lock: lookups of other documents go on, queries of this one are answered by postgres meanwhile
+            try:
+                self._build(db, document_id)
+            finally:
+                with self._lock:
+                    self._building.discard(document_id)
+            index = self._open(document_id)
+            if index is None:
+                return None
+
+        with self._lock:
+            self._drop(document_id)  # mapped by a concurrent lookup in the meantime
+            self._query_counts.pop(document_id, None)
+            self._indexes[document_id] = index
+            self.nbytes += index.nbytes
+            while self.nbytes > self.max_bytes and len(self._indexes) > 1:
+                self._drop(next(iter(self._indexes)))
+            return index
+
+    def _drop(self, document_id: int) -> None:
+        index = self._indexes.pop(document_id, None)
+        if index is not None:
+            self.nbytes -= index.nbytes
+
+    def search(self, db: DBSession, document_id: int, query_vector, k: int) -> Optional[list]:
+        """Return the k chunks of a document closest to the query vector.
+
+        Args:
+            db: database session, used for the chunk texts and to build snapshots.
+            document_id: indexed document.
+            query_vector: query embedding.
+            k: number of chunks.
+
+        Returns:
+            list: SearchRow items best first, or None if the document is not (or no longer) in the index.
+        """
+        index = self._get(db, document_id)
+        if index is None:
+            self.misses += 1
+            memory_index_lookups.labels("miss").inc()
+            return None
+
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+        rescore = self.precision != "float32"
+        scores: np.ndarray
+        if rescore:
+            positions, scores = top_n(coarse_scores(index.vectors, query_vector, self.precision), max(k, settings.vector_rescore_depth)), np.empty(0, dtype=np.float32)
+        else:
+            positions, scores = top_k(index.vectors, query_vector, k)
+        chunk_ids = index.ids[positions]
+        rows = crud.get_chunks_by_ids(db, chunk_ids, with_vectors=rescore)
+        if len(rows) != len(chunk_ids):
+            # chunks were replaced after the snapshot was written
+            logger.info(f"Memory index snapshot of document {document_id} is stale")
+            self.invalidate(document_id)
+            self.misses += 1
+            memory_index_lookups.labels("miss").inc()
+            return None
+
+        self.hits += 1
+        memory_index_lookups.labels("hit").inc()
+        if rescore and len(chunk_ids):
+            # exact cosine similarity of the candidates
+            vectors = np.stack([np.asarray(rows[int(chunk_id)].vector, dtype=np.float32) for chunk_id in chunk_ids])
+            positions, scores = top_k(vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12), query_vector, k)
+            chunk_ids = chunk_ids[positions]
+        return [
+            SearchRow(row.id, row.document_id, row.page_start, row.page_end, row.text, float(score)) for row, score in zip((rows[int(chunk_id)] for chunk_id in chunk_ids), scores)
+        ]
+
+    def invalidate(self, document_id: int) -> None:
+        """Forget a document and delete its snapshot, called on delete and re-index."""
+        with self._lock:
+            self._drop(document_id)
+            self._query_counts.pop(document_id, None)
+            # snapshots of every precision
+            for path in [self._paths(document_id)[0], *(os.path.join(self.directory, f"{document_id}.{precision}.npy") for precision in PRECISIONS)]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._indexes),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "builds": self.builds,
+        }
+
+
+memory_index = MemoryIndex()
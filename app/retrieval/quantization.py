@@ -0,0 +1,61 @@
+"""Compact vector codes for the coarse stage of a two-stage search, candidates are rescored on float32 vectors.
+
+float16 halves the bytes per vector, int8 divides them by 4 and binary (one sign bit per dimension,
+compared with the Hamming distance) by 32. Codes of a matrix share one int8 scale, so the ranking of
+int8 dot products does not depend on it and it is not stored.
+"""
+
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8", "binary")
+BLOCK_ROWS = 65536  # rows widened to float32 at a time by float16 and int8 scoring
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def check_precision(precision: str) -> None:
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown vector precision: {precision}, expected one of {PRECISIONS}")
+
+
+def encode(vectors: np.ndarray, precision: str) -> np.ndarray:
+    """Return the codes of a (rows, dim) float32 matrix: float32, float16, int8 or packed sign bits (uint8)."""
+    check_precision(precision)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if precision == "float32":
+        return vectors
+    if precision == "float16":
+        return vectors.astype(np.float16)
+    if precision == "int8":
+        scale = 127.0 / max(float(np.abs(vectors).max(initial=0.0)), 1e-12)
+        return np.clip(np.rint(vectors * scale), -127, 127).astype(np.int8)
+    return np.packbits(vectors > 0, axis=-1)
+
+
+def bytes_per_vector(dim: int, precision: str) -> int:
+    check_precision(precision)
+    return {"float32": 4 * dim, "float16": 2 * dim, "int8": dim, "binary": (dim + 7) // 8}[precision]
+
+
+def coarse_scores(codes: np.ndarray, query_vector: np.ndarray, precision: str) -> np.ndarray:
+    """Score every code against a float32 query, higher is closer (negated Hamming distance for binary)."""
+    check_precision(precision)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    if precision == "binary":
+        query_code = np.packbits(query_vector > 0)
+        return -POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.int32)
+    if precision == "float32":
+        return codes @ query_vector
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), BLOCK_ROWS):
+        scores[start : start + BLOCK_ROWS] = codes[start : start + BLOCK_ROWS].astype(np.float32) @ query_vector
+    return scores
+
+
+def top_n(scores: np.ndarray, n: int) -> np.ndarray:
+    """Positions of the n highest scores, best first."""
+    n = min(n, len(scores))
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, n - 1)[:n]
+    return best[np.argsort(-scores[best], kind="stable")]
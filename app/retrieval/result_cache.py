@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, cast
+
+import redis
+from fastapi.concurrency import run_in_threadpool
+
+from app.huggingface.cache import normalize_text
+from app.metrics import qa_cache_lookups
+from app.settings import settings
+from app.tasks import redis_conn
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "qa"
+
+
+class ResultCache:
+    """
+    Cache of /qa/ results: an in-process LRU in front of redis, with single-flight computation of misses.
+
+    Keys are built from the document id and version, the normalized query, k and the retrieval options.
+    The version is bumped whenever the chunks of a document are replaced, so entries of a re-indexed
+    document are never read again and expire with their TTL; a deleted document is rejected before
+    the cache is looked up. Concurrent misses of a key in this process wait for the first one to
+    compute the result. Redis failures are logged and treated as misses.
+
+    Methods:
+        - make_key(document_id, version, query, k, options): Builds the cache key of a query.
+        - get_or_compute(key, compute): Returns the cached result, or awaits compute() once for all concurrent callers.
+        - stats(): Returns the hit/miss counters.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis] = redis_conn, max_items: Optional[int] = None, ttl_s: Optional[int] = None):
+        self.redis_client = redis_client
+        self.max_items = max_items or settings.qa_cache_local_max_items
+        self.ttl_s = ttl_s or settings.qa_cache_ttl_s
+        self._local: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: dict = {}
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.shared = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    @staticmethod
+    def make_key(document_id: int, version: int, query: str, k: int, options: dict) -> str:
+        params = json.dumps({"query": normalize_text(query), "k": k, **options}, sort_keys=True, default=str)
+        return f"{KEY_PREFIX}:{document_id}:{version}:{hashlib.sha256(params.encode('utf-8')).hexdigest()}"
+
+    def _get_local(self, key: str) -> Optional[list]:
+        with self._lock:
+            value = self._local.get(key)
+            if value is not None:
+                self._local.move_to_end(key)
+            return value
+
+    def _set_local(self, key: str, value: list) -> None:
+        with self._lock:
+            self._local[key] = value
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_items:
+                self._local.popitem(last=False)
+
+    def _get_remote(self, key: str) -> Optional[list]:
+        if self.redis_client is None:
+            return None
+        try:
+            value = cast(Optional[bytes], self.redis_client.get(key))
+        except redis.RedisError as e:
+            self.redis_errors += 1
+            logger.warning(f"QA cache lookup failed, treating as a miss: {e}")
+            return None
+        return json.loads(value) if value is not None else None
+
+    def _set_remote(self, key: str, value: list) -> None:
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.setex(key, self.ttl_s, json.dumps(value))
+        except redis.RedisError as e:
+            self.redis_errors += 1
+            logger.warning(f"QA cache write failed: {e}")
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[list]]) -> list:
+        """Return the result of a key from the local LRU, a concurrent computation, redis or compute(), in that order.
+
+        Errors of compute() reach every caller waiting for it and nothing is cached.
+        """
+        while True:
+            value = self._get_local(key)
+            if value is not None:
+                self.local_hits += 1
+                qa_cache_lookups.labels("local_hit").inc()
+                return value
+
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self.shared += 1
+            qa_cache_lookups.labels("shared").inc()
+            try:
+                # shielded: a caller going away must not cancel the computation of the others
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # the request computing it went away, try again
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await run_in_threadpool(self._get_remote, key)
+            if value is not None:
+                self.redis_hits += 1
+                qa_cache_lookups.labels("redis_hit").inc()
+            else:
+                self.misses += 1
+                qa_cache_lookups.labels("miss").inc()
+                value = await compute()
+                await run_in_threadpool(self._set_remote, key, value)
+            self._set_local(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, whether or not anyone waits for it
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.local_hits + self.redis_hits + self.shared + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "shared": self.shared,
+            "misses": self.misses,
+            "redis_errors": self.redis_errors,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "local_items": len(self._local),
+            "inflight": len(self._inflight),
+        }
+
+
+result_cache = ResultCache()
@@ -11,16 +11,28 @@ class Settings(BaseSettings):
     # core
     pdfs_data_dir: str = "/data/tmp/pdfs"
     pgvector_dbdir: str = "/data/pgvector/data"
+    # chunk_embeddings is hash partitioned by document, changing the count needs bin/migrate
+    chunk_partitions: int = 16
+    chunk_delete_batch_size: int = 5000  # rows per transaction when deleting the chunks of a document
 
-    # chunker
-    chunk_size: int = 1500
-    chunk_overlap: int = 200
+    # pdf extraction
+    pdf_extractor: str = "pymupdf"  # pymupdf | pypdf2
+    pdf_extract_workers: int = 2  # extraction processes, 1 extracts in the task process
+    pdf_extract_pages_per_task: int = 16
+    pdf_extract_start_method: str = "forkserver"
+    index_embed_batch_chunks: int = 256  # staged chunks embedded and written back per batch of the embedding stage
+    index_shard_pages: int = 64  # larger documents are indexed as page-range shards by several workers
+    index_progress_ttl_s: int = 24 * 60 * 60
+
+    # chunker, sizes are in tokens of the embedding model
+    chunk_size: int = 500  # capped to embedding_max_length minus the special tokens
+    chunk_overlap: int = 50
+    # tried in order, a separator starting with "(?" is a regex, "" splits into characters
     separators: list = [
         "\n\n",
         "\n",
-        "(?<=\. )",
+        r"(?<=\. )",
         " ",
-        "",
         ".",
         ",",
         "\u200b",  # Zero-width space
@@ -28,20 +40,103 @@ class Settings(BaseSettings):
         "\u3001",  # Ideographic comma
         "\uff0e",  # Fullwidth full stop
         "\u3002",  # Ideographic full stop
+        "",
     ]
 
+    # embeddings
+    embedding_model_name: str = "BAAI/bge-large-en"  # e.g. BAAI/bge-small-en-v1.5 (with embedding_dim=384) for lower latency
+    embedding_backend: str = "torch"  # torch | torch-int8 | onnx
+    onnx_cache_dir: str = "/data/models/onnx"
+    embedding_batch_size: int = 32
+    embedding_max_length: int = 512  # tokens, model window
+    embedding_dim: int = 1024
+    embedding_pooling: str = "cls"  # cls | mean
+    embedding_normalize: bool = True
+    # mmap: every process maps the read-only checkpoint (safetensors, or zip torch.save), its pages are shared through
+    # the page cache; copy: each process loads a private copy of the weights with from_pretrained
+    embedding_model_load: str = "mmap"
+    embedding_num_threads: int = 0  # torch / onnxruntime threads per process, 0 uses one per core; bin/run_dramatiq splits the cores between processes
+
+    # embedding cache (in-process LRU in front of redis db `embeddings_redis_db`)
+    embedding_cache_enabled: bool = True
+    embedding_cache_local_max_items: int = 10000
+    embedding_cache_ttl_s: int = 7 * 24 * 60 * 60  # 7 days
+    # maxmemory is server wide, leave empty to keep the redis server setting.
+    # volatile-* policies only evict keys with a TTL, so the dramatiq queues are never evicted.
+    embedding_cache_redis_maxmemory: str = ""
+    embedding_cache_redis_maxmemory_policy: str = "volatile-lru"
+
+    # api concurrency
+    model_warmup_on_startup: bool = True  # load the model in the background when the API starts
+    inference_max_workers: int = 1  # concurrent forward passes per API process
+    inference_max_queue: int = 64  # waiting inference calls before /qa/ answers 503
+    embedding_batch_max_size: int = 32  # queries coalesced into one forward pass
+    embedding_batch_max_wait_ms: float = 2.0  # how long a batch waits for more queries
+    # downloads run in the extraction stage
+    download_timeout_s: float = 60.0  # per read, write and pool wait
+    download_connect_timeout_s: float = 10.0
+    download_max_bytes: int = 200 * 1024 * 1024
+    download_max_connections: int = 20
+    download_chunk_size: int = 64 * 1024
+    batch_max_items: int = 1000  # urls of /upload/batch, queries of /qa/batch
+    batch_search_concurrency: int = 4  # searches of a /qa/batch at the same time, each holds a db connection (two in hybrid mode)
+
+    # /qa/ result cache, keyed by document version so re-indexed documents never answer from old entries
+    qa_cache_enabled: bool = True
+    qa_cache_ttl_s: int = 60 * 60
+    qa_cache_local_max_items: int = 10000
+
+    # vector search
+    qa_top_k: int = 5
+    vector_index_type: str = "hnsw"  # hnsw | ivfflat
+    hnsw_m: int = 16
+    hnsw_ef_construction: int = 64
+    hnsw_ef_search: int = 100
+    ivfflat_lists: int = 100
+    ivfflat_probes: int = 10
+    # pgvector >= 0.8: keep scanning the index until k rows pass the document filter, empty disables
+    vector_iterative_scan: str = "relaxed_order"
+    # vector | halfvec | bit: what the ANN index stores, halfvec and bit candidates are rescored on the float32 column
+    vector_index_precision: str = "vector"
+    vector_rescore_depth: int = 100  # candidates of a compact index (or memory index) rescored per query
+    search_max_k: int = 100
+
+    # hybrid retrieval: full-text (ts_rank) and vector top-k merged with reciprocal rank fusion
+    retrieval_mode: str = "vector"  # vector | hybrid, default of requests that do not set `mode`
+    text_search_config: str = "english"  # used by the generated tsvector column, changing it needs a migration
+    hybrid_candidate_depth: int = 50  # candidates fetched by each leg
+    hybrid_max_candidate_depth: int = 1000
+    hybrid_vector_weight: float = 1.0
+    hybrid_lexical_weight: float = 1.0
+    hybrid_rrf_k: int = 60
+
+    # in-memory index of hot documents: .npy snapshots memory mapped by every process on the host
+    memory_index_enabled: bool = False
+    memory_index_dir: str = "/data/index"
+    memory_index_max_bytes: int = 512 * 1024 * 1024  # mapped vectors per process, least recently used are dropped
+    memory_index_min_queries: int = 3  # queries of a document before it gets a snapshot
+    memory_index_precision: str = "float32"  # float32 | float16 | int8 | binary, compact codes are rescored
+
+    # observability: per request sampling profiles, see app/profiling.py
+    profiling_enabled: bool = False
+    profiling_dir: str = "/data/profiles"
+    profiling_interval_s: float = 0.001
+
     # postgres
     postgres_host: str = "postgres"
     postgres_port: int = 5432
     postgres_db: str = "postgres"
     postgres_user: str = "postgres"
     postgres_password: str = "postgres"
+    chunk_insert_batch_size: int = 1000  # rows per COPY buffer
 
     # dramatiq
     dramatiq_name_space: str = "embedding-dramatiq"
     dramatiq_task_time_limit_ms: int = 30 * 60000  # 30 minutes
     dramatiq_task_max_retries: int = 2
     dramatiq_task_max_age_ms: int = 3 * 60 * 60 * 1000  # 3 hour
+    extraction_queue: str = "extraction"  # download, PDF parsing and chunking
+    embedding_queue: str = "embedding"  # model inference, scaled separately
     redis_host: str = "redis"
     redis_port: int = 6379
     dramatiq_redis_db: int = 0
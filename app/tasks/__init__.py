@@ -1,7 +1,10 @@
 """Orchestrator module."""
+
 import dramatiq
 import redis
 from dramatiq.brokers.redis import RedisBroker
+from dramatiq.middleware import GroupCallbacks, Prometheus
+from dramatiq.rate_limits.backends import RedisBackend
 
 
 from app.settings import settings
@@ -13,6 +16,11 @@ broker = RedisBroker(
     db=settings.dramatiq_redis_db,
     namespace=settings.dramatiq_name_space,
 )
+# completion barrier of group(...).add_completion_callback(), counted in redis
+broker.add_middleware(GroupCallbacks(RedisBackend(host=settings.redis_host, port=settings.redis_port, db=settings.dramatiq_redis_db)))
+# per actor message counters and durations, served with app/metrics.py on dramatiq_prom_port by every worker
+if not any(isinstance(middleware, Prometheus) for middleware in broker.middleware):
+    broker.add_middleware(Prometheus())
 dramatiq.set_broker(broker)
 
 redis_conn = redis.Redis(settings.redis_host, port=settings.redis_port, db=settings.embeddings_redis_db)
@@ -1,19 +1,26 @@
 import logging
 import os
-from itertools import chain
-from PyPDF2 import PdfReader
+import numpy as np
 from types import MappingProxyType
+from typing import Optional
 from app.database import crud
 from app.models.document import DocumentEventsEnum, DocumentStatusEnum
 from app.database.session import db_context
 from app.tasks import dramatiq
+from app.tasks.progress import clear_progress, mark_shard_done, start_progress
 from app.settings import settings
-from app.huggingface.manager import ModelManager
+from app.huggingface.cache import text_hash
+from app.huggingface.embedding import EmbeddingService
+from app.metrics import timed
+from app.pdf.chunker import RecursiveChunker
+from app.pdf.download import DownloadRejected, download_document
+from app.pdf.extract import get_extractor, iter_pages
+from app.retrieval.memory_index import memory_index
 
 logger = logging.getLogger(__name__)
 
-model_manager = ModelManager()
-embedding_model = model_manager.get_model()
+embedding_service = EmbeddingService()
+chunker = RecursiveChunker()
 
 
 def document_state_mapping() -> MappingProxyType:
@@ -25,14 +32,25 @@ def document_state_mapping() -> MappingProxyType:
                 DocumentEventsEnum.DELETE_REQUEST: delete_document,
             },
             DocumentStatusEnum.LOAD: {
-                DocumentEventsEnum.LOAD_FINISHED: mark_as_indexed,
-                DocumentEventsEnum.LOAD_FAILED: mark_as_failed,
+                DocumentEventsEnum.LOAD_FINISHED: mark_as_extracted,
+                DocumentEventsEnum.LOAD_FAILED: mark_extraction_as_failed,
+                DocumentEventsEnum.DELETE_REQUEST: delete_document,
+            },
+            DocumentStatusEnum.READY_TO_BE_INDEXED: {
+                DocumentEventsEnum.EMBEDDING_REQUEST: embed_document,
+                DocumentEventsEnum.DELETE_REQUEST: delete_document,
+            },
+            DocumentStatusEnum.EXTRACTING_EMBEDDINGS: {
+                DocumentEventsEnum.EMBEDDING_FINISHED: mark_as_indexed,
+                DocumentEventsEnum.EMBEDDING_FAILED: mark_as_failed,
                 DocumentEventsEnum.DELETE_REQUEST: delete_document,
             },
             DocumentStatusEnum.INDEXED: {
+                DocumentEventsEnum.LOAD_REQUEST: download_and_chunk_document,
                 DocumentEventsEnum.DELETE_REQUEST: delete_document,
             },
             DocumentStatusEnum.FAILED: {
+                # an unchanged document whose embedding stage failed goes straight back to embedding
                 DocumentEventsEnum.LOAD_REQUEST: download_and_chunk_document,
                 DocumentEventsEnum.DELETE_REQUEST: delete_document,
             },
@@ -61,12 +79,97 @@ def move_document_forward(document_id: int, event: str, **kwargs) -> None:
         logger.exception(f"Status mapping is not available. {status=}, event: {event=}")
 
 
+def move_documents_forward(documents: dict, event: str) -> int:
+    """Move many documents forward on the same event, from statuses the caller already read.
+
+    Args:
+        documents: {document id: current status}.
+        event: event of every document.
+
+    Returns:
+        int: number of messages sent.
+    """
+    mapping = document_state_mapping()
+    sent = 0
+    for document_id, status in documents.items():
+        next_task = mapping.get(status, {}).get(event)
+        if next_task:
+            next_task.send(document_id=document_id)
+            sent += 1
+    logger.info(f"Event {event} for {len(documents)} documents, sent {sent} messages")
+    return sent
+
+
+def embed_chunks(db_session, texts: list) -> tuple:
+    """Embed chunk texts, reusing the stored vectors of identical chunks of any document.
+
+    Returns:
+        tuple: (vectors, number of reused vectors).
+    """
+    text_hashes = [text_hash(text) for text in texts]
+    stored = crud.get_vectors_by_text_hash(db_session, text_hashes, embedding_service.vector_namespace)
+    missing = [text for text, chunk_hash in zip(texts, text_hashes) if chunk_hash not in stored]
+    computed = iter(embedding_service.embed(missing)) if missing else iter(())
+    vectors = np.stack([stored[chunk_hash] if chunk_hash in stored else next(computed) for chunk_hash in text_hashes])
+    return vectors, len(texts) - len(missing)
+
+
+def stage_pages(db_session, document_id: int, file_path: str, start_page: int = 0, stop_page: Optional[int] = None) -> int:
+    """Chunk the pages [start_page, stop_page) of a PDF and stage the chunk texts, without vectors.
+
+    Returns:
+        int: number of staged chunks.
+    """
+    # at most index_shard_pages pages, materialized so extraction and chunking are timed apart
+    with timed("extract"):
+        pages = list(iter_pages(file_path, start_page=start_page, stop_page=stop_page))
+    with timed("chunk"):
+        chunks = list(chunker.chunk_pages(pages))
+    with timed("db_write"):
+        return crud.replace_staged_chunks(
+            db_session,
+            document_id=document_id,
+            shard=start_page,
+            texts=[chunk.text for chunk in chunks],
+            vectors=None,
+            pages=[(chunk.page_start, chunk.page_end) for chunk in chunks],
+            text_hashes=[text_hash(chunk.text) for chunk in chunks],
+        )
+
+
+def send_shards(document_id: int, page_count: int) -> None:
+    """Extract a large document as page-range shards, processed in parallel by any extraction worker.
+
+    The completion callback of the group fires LOAD_FINISHED once every shard staged its chunks.
+    A shard failing for good fires LOAD_FAILED through `stage_failed` instead.
+    """
+    start_progress(document_id, page_count)
+    shards = [extract_page_range.message(document_id, start, min(start + settings.index_shard_pages, page_count)) for start in range(0, page_count, settings.index_shard_pages)]
+    group = dramatiq.group(shards)
+    group.add_completion_callback(finish_extraction.message(document_id))
+    group.run()
+    logger.info(f"Document {document_id}: sent {len(shards)} shards of {settings.index_shard_pages} pages")
+
+
 @dramatiq.actor(
+    queue_name=settings.extraction_queue,
     max_retries=settings.dramatiq_task_max_retries,
     time_limit=settings.dramatiq_task_time_limit_ms,
     max_age=settings.dramatiq_task_max_age_ms,
+    on_failure="stage_failed",
+    throws=(DownloadRejected,),
 )
-def download_and_chunk_document(document_id: int) -> None:
+def download_and_chunk_document(document_id: int, download: bool = True) -> None:
+    """Extraction stage: download the url, chunk the PDF into chunk_staging, then fire LOAD_FINISHED.
+
+    The url is fetched conditionally when its previous download is still on disk. An indexed document
+    stays INDEXED until its new version is downloaded: when its PDF did not change, or the download is
+    rejected, the indexed version is kept. A failed one that still has staged chunks (its embedding stage
+    failed) goes on to the embedding stage. `download=False` chunks the stored file as is.
+
+    Errors are raised so dramatiq retries the stage, every attempt starts from an empty staging area.
+    A rejected download (too large, 4xx) of a document that is not indexed fails the stage at once.
+    """
     logger.info(f"Downloading and chunking document: {document_id}")
 
     with db_context() as db_session:
@@ -75,59 +178,164 @@ def download_and_chunk_document(document_id: int) -> None:
             logger.error(f"Document not found! {document_id=}")
             return
 
-        try:
-            file_path = document.file_path
-            if os.path.isfile(file_path):
-                with open(file_path, "rb") as pdf_file:
-                    pdf_reader = PdfReader(pdf_file)
-
-                    if embedding_model is None:
-                        logger.error("Failed to load the embedding model. embedding_model is None.")
-                        raise RuntimeError("Failed to load the embedding model.")
-
-                    logger.info("Embedding model loaded successfully.")
-
-                    for page in pdf_reader.pages:
-                        text = page.extract_text()
-                        if text:
-                            words = text.split()
-                            chunk_size = 100
-
-                            for i in range(0, len(words), chunk_size):
-                                chunk = " ".join(words[i : i + chunk_size])
-                                logger.info(f"Processing chunk: {chunk}")
-
-                                try:
-                                    raw_vector = embedding_model(chunk)[0] if chunk else None
-                                    logger.info(f"Raw vector length (before processing): {len(raw_vector)}")
-
-                                    if raw_vector:
-                                        # Ensure the vector is flat
-                                        if isinstance(raw_vector[0], list):
-                                            flat_vector = list(chain.from_iterable(raw_vector))
-                                        else:
-                                            flat_vector = raw_vector
-
-                                        logger.info(f"Flattened vector length: {len(flat_vector)}")
-
-                                        # Chunk vector if needed
-                                        max_dimensions = 16000
-                                        for j in range(0, len(flat_vector), max_dimensions):
-                                            vector_chunk = flat_vector[j : j + max_dimensions]
-                                            logger.info(f"Storing vector chunk of length: {len(vector_chunk)}")
-                                            crud.insert_chunk(db_session, document_id=document_id, chunk=chunk, vector=vector_chunk)
-                                except Exception as e:
-                                    logger.error(f"Error generating vector for chunk: {e}")
-                                    continue
-
-                    crud.update_document_status(db_session, document_id, DocumentStatusEnum.INDEXED)
-                    logger.info(f"Document {document_id} has been successfully indexed.")
-            else:
-                raise FileNotFoundError(f"File not found at path: {file_path}")
+        previous_status = document.status
+        if previous_status != DocumentStatusEnum.INDEXED:
+            crud.update_document_status(db_session, document_id, DocumentStatusEnum.LOAD)
+        file_path = document.file_path
+        has_file = bool(file_path) and os.path.isfile(file_path)
+        if download and document.url:
+            try:
+                if has_file:
+                    fetched = download_document(document.url, etag=document.etag, last_modified=document.last_modified)
+                else:
+                    fetched = download_document(document.url)
+            except DownloadRejected as e:
+                if previous_status != DocumentStatusEnum.INDEXED:
+                    raise
+                logger.warning(f"Download of document {document_id} rejected, keeping its indexed version: {e}")
+                return
+            unchanged = fetched is None or (has_file and fetched.file_hash == document.file_hash)
+            if unchanged and previous_status == DocumentStatusEnum.INDEXED:
+                logger.info(f"Document {document_id} is unchanged")
+                return
+            if unchanged and previous_status == DocumentStatusEnum.FAILED and crud.has_staged_chunks(db_session, document_id):
+                logger.info(f"Document {document_id} is unchanged, embedding the chunks staged before its embedding stage failed")
+                move_document_forward(document_id, DocumentEventsEnum.LOAD_FINISHED.value)
+                return
+            if fetched is not None:
+                crud.update_document_file(db_session, document_id, fetched.file_path, fetched.file_hash, fetched.etag, fetched.last_modified)
+                db_session.refresh(document)
+                file_path = fetched.file_path
+
+        # an indexed document stays searchable under its previous version until the new one is downloaded
+        if previous_status == DocumentStatusEnum.INDEXED:
+            crud.update_document_status(db_session, document_id, DocumentStatusEnum.LOAD)
+        if not file_path or not os.path.isfile(file_path):
+            raise FileNotFoundError(f"File not found at path: {file_path}")
+
+        # the same PDF is already indexed under another url: copy its chunks instead of extracting and embedding
+        source = crud.get_indexed_document_by_file_hash(db_session, document.file_hash, exclude_document_id=document_id) if document.file_hash else None
+        if source:
+            with timed("db_write"):
+                count = crud.copy_chunks(db_session, source.id, document_id)
+            memory_index.invalidate(document_id)
+            crud.update_document_status(db_session, document_id, DocumentStatusEnum.INDEXED)
+            logger.info(f"Document {document_id} is identical to document {source.id}, copied {count} chunks")
+            return
 
-        except Exception as e:
-            logger.error(f"Error occurred while downloading and chunking document: {e}")
-            crud.update_document_status(db_session, document_id, DocumentStatusEnum.FAILED)
+        crud.delete_staged_chunks(db_session, document_id)
+        page_count = get_extractor().page_count(file_path)
+        if page_count > settings.index_shard_pages:
+            send_shards(document_id, page_count)
+            return
+
+        count = stage_pages(db_session, document_id, file_path)
+        logger.info(f"Document {document_id}: staged {count} chunks of {page_count} pages")
+
+    move_document_forward(document_id, DocumentEventsEnum.LOAD_FINISHED.value)
+
+
+@dramatiq.actor(
+    queue_name=settings.extraction_queue,
+    max_retries=settings.dramatiq_task_max_retries,
+    time_limit=settings.dramatiq_task_time_limit_ms,
+    max_age=settings.dramatiq_task_max_age_ms,
+    on_failure="stage_failed",
+)
+def extract_page_range(document_id: int, start_page: int, stop_page: int) -> None:
+    """Chunk and stage the pages [start_page, stop_page) of a document.
+
+    Errors are raised so dramatiq retries the shard, a retry replaces what the previous attempt staged.
+    The document fails only once the retries of a shard are exhausted, see `stage_failed`.
+    """
+    with db_context() as db_session:
+        document = crud.get_document(db_session, document_id)
+        if not document or document.status != DocumentStatusEnum.LOAD:
+            logger.info(f"Skipping pages {start_page}-{stop_page} of document {document_id}, it is no longer loading")
+            return
+        stage_pages(db_session, document_id, document.file_path, start_page, stop_page)
+    mark_shard_done(document_id, start_page, stop_page - start_page)
+
+
+@dramatiq.actor(
+    max_retries=settings.dramatiq_task_max_retries,
+    time_limit=settings.dramatiq_task_time_limit_ms,
+    max_age=settings.dramatiq_task_max_age_ms,
+)
+def finish_extraction(document_id: int) -> None:
+    """Completion barrier of the extraction shards: fire LOAD_FINISHED."""
+    clear_progress(document_id)
+    move_document_forward(document_id, DocumentEventsEnum.LOAD_FINISHED.value)
+
+
+@dramatiq.actor(
+    queue_name=settings.embedding_queue,
+    max_retries=settings.dramatiq_task_max_retries,
+    time_limit=settings.dramatiq_task_time_limit_ms,
+    max_age=settings.dramatiq_task_max_age_ms,
+    on_failure="stage_failed",
+)
+def embed_document(document_id: int) -> None:
+    """Embedding stage: embed the staged chunks, swap them in and fire EMBEDDING_FINISHED.
+
+    Vectors are written back to the staging rows batch by batch, so a retry only embeds the chunks
+    the previous attempt did not get to.
+    """
+    logger.info(f"Embedding document: {document_id}")
+
+    with db_context() as db_session:
+        document = crud.get_document(db_session, document_id)
+        if not document:
+            logger.error(f"Document not found! {document_id=}")
+            return
+
+        crud.update_document_status(db_session, document_id, DocumentStatusEnum.EXTRACTING_EMBEDDINGS)
+        embedded, reused = 0, 0
+        while True:
+            rows = crud.get_unembedded_staged_chunks(db_session, document_id, limit=settings.index_embed_batch_chunks)
+            if not rows:
+                break
+            vectors, batch_reused = embed_chunks(db_session, [row.text for row in rows])
+            with timed("db_write"):
+                crud.set_staged_vectors(db_session, [row.id for row in rows], vectors, embedding_service.vector_namespace)
+            embedded += len(rows) - batch_reused
+            reused += batch_reused
+
+        # one transaction per document, a failure leaves the previous chunks in place
+        with timed("db_write"):
+            count = crud.promote_staged_chunks(db_session, document_id)
+        logger.info(f"Document {document_id}: embedded {embedded} chunks, reused {reused} stored vectors, stored {count} chunks")
+
+    memory_index.invalidate(document_id)
+    move_document_forward(document_id, DocumentEventsEnum.EMBEDDING_FINISHED.value)
+
+
+def retries_exhausted(message_data: dict, exception_data: dict) -> bool:
+    """Whether a failed stage message is not retried anymore: it raised one of its `throws` or used all its retries."""
+    actor = stage_failed.broker.get_actor(message_data["actor_name"])
+    if exception_data["type"] in {exception.__name__ for exception in actor.options.get("throws") or ()}:
+        return True
+    max_retries = message_data["options"].get("max_retries") or actor.options.get("max_retries", 0)
+    # the Retries middleware runs before Callbacks, "retries" already counts the failed attempt
+    return message_data["options"].get("retries", 0) > max_retries
+
+
+@dramatiq.actor(max_retries=settings.dramatiq_task_max_retries)
+def stage_failed(message_data: dict, exception_data: dict) -> None:
+    """on_failure callback of a stage: fire LOAD_FAILED or EMBEDDING_FAILED once the stage is not retried anymore.
+
+    Callbacks sends on_failure after every failed attempt, an attempt that is retried is only logged.
+    """
+    document_id = message_data["kwargs"].get("document_id") or message_data["args"][0]
+    if not retries_exhausted(message_data, exception_data):
+        logger.warning(f"{message_data['actor_name']} failed for document {document_id}, retrying: {exception_data.get('message')}")
+        return
+    logger.error(f"{message_data['actor_name']} failed for document {document_id}: {exception_data.get('message')}")
+    if message_data["actor_name"] == embed_document.actor_name:
+        move_document_forward(document_id, DocumentEventsEnum.EMBEDDING_FAILED.value)
+    else:
+        clear_progress(document_id)
+        move_document_forward(document_id, DocumentEventsEnum.LOAD_FAILED.value)
 
 
 @dramatiq.actor(
@@ -144,6 +352,7 @@ def delete_document(document_id: int) -> None:
             document = crud.get_document(db_session, document_id=document_id)
             if document:
                 crud.delete_document(db_session, document_id=document_id)
+                memory_index.invalidate(document_id)
                 crud.update_document_status(db_session, document_id, DocumentStatusEnum.DELETED)
             else:
                 logger.error(f"Document not found! {document_id=}")
@@ -158,14 +367,47 @@ def delete_document(document_id: int) -> None:
     max_age=settings.dramatiq_task_max_age_ms,
 )
 def mark_as_failed(document_id: int) -> None:
-    """Mark document as failed.
+    """Mark document as failed, its staged chunks are kept for the next upload.
 
     Args:
         document_id: document id to process.
     """
     logger.info(f"Marking document as failed - {document_id}")
     with db_context() as db_session:
-        crud.update_document_status(db_session, document_id=document_id, status=DocumentStatusEnum.FAILED)
+        crud.fail_document(db_session, document_id)
+
+
+@dramatiq.actor(
+    max_retries=settings.dramatiq_task_max_retries,
+    time_limit=settings.dramatiq_task_time_limit_ms,
+    max_age=settings.dramatiq_task_max_age_ms,
+)
+def mark_extraction_as_failed(document_id: int) -> None:
+    """Mark document as failed and drop what its extraction staged, the next upload extracts it again.
+
+    Args:
+        document_id: document id to process.
+    """
+    logger.info(f"Marking document as failed in the extraction stage - {document_id}")
+    with db_context() as db_session:
+        crud.fail_document(db_session, document_id, delete_staged=True)
+
+
+@dramatiq.actor(
+    max_retries=settings.dramatiq_task_max_retries,
+    time_limit=settings.dramatiq_task_time_limit_ms,
+    max_age=settings.dramatiq_task_max_age_ms,
+)
+def mark_as_extracted(document_id: int) -> None:
+    """Mark document as ready to be indexed and request its embeddings.
+
+    Args:
+        document_id: document id to process.
+    """
+    logger.info(f"Marking document as ready to be indexed - {document_id}")
+    with db_context() as db_session:
+        crud.update_document_status(db_session, document_id, status=DocumentStatusEnum.READY_TO_BE_INDEXED)
+    move_document_forward(document_id, DocumentEventsEnum.EMBEDDING_REQUEST.value)
 
 
 @dramatiq.actor(
@@ -0,0 +1,54 @@
+"""Indexing progress of sharded documents, kept in redis so every worker and API process sees it."""
+
+import logging
+from typing import Optional, cast
+
+import redis
+
+from app.settings import settings
+from app.tasks import redis_conn
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "progress"
+TOTAL_PAGES = "total_pages"
+
+
+def progress_key(document_id: int) -> str:
+    return f"{KEY_PREFIX}:{document_id}"
+
+
+def start_progress(document_id: int, total_pages: int) -> None:
+    """Reset the progress of a document before its shards are sent."""
+    key = progress_key(document_id)
+    with redis_conn.pipeline() as pipe:
+        pipe.delete(key)
+        pipe.hset(key, TOTAL_PAGES, str(total_pages))
+        pipe.expire(key, settings.index_progress_ttl_s)
+        pipe.execute()
+
+
+def mark_shard_done(document_id: int, shard: int, pages: int) -> None:
+    """Record a finished shard, recording the same shard twice (a retried message) counts it once."""
+    try:
+        redis_conn.hset(progress_key(document_id), f"shard:{shard}", str(pages))
+    except redis.RedisError as e:
+        logger.warning(f"Unable to record progress of document {document_id}: {e}")
+
+
+def get_progress(document_id: int) -> Optional[dict]:
+    """Return {"pages_done", "pages_total"} of a document being indexed in shards, None otherwise."""
+    try:
+        stored = cast(dict, redis_conn.hgetall(progress_key(document_id)))
+    except redis.RedisError as e:
+        logger.warning(f"Unable to read progress of document {document_id}: {e}")
+        return None
+    if not stored:
+        return None
+    values = {key.decode(): int(value) for key, value in stored.items()}
+    pages_total = values.pop(TOTAL_PAGES, 0)
+    return {"pages_done": min(sum(values.values()), pages_total), "pages_total": pages_total}
+
+
+def clear_progress(document_id: int) -> None:
+    redis_conn.delete(progress_key(document_id))
@@ -0,0 +1,87 @@
+import random
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+pytest.importorskip("redis")
+pytest.importorskip("dramatiq")
+
+from app.huggingface.backends import load_backend  # noqa: E402
+from app.huggingface.cache import EmbeddingCache  # noqa: E402
+from app.huggingface.embedding import EmbeddingService  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+# same threshold as bench_backends --min-cosine
+MIN_COSINE = 0.98
+WORDS = [f"w{i}" for i in range(200)]
+
+
+class StaticManager:
+    def __init__(self, model):
+        self.model = model
+
+    def get_model(self):
+        return self.model
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    """A small BERT with random weights and a word-level vocabulary, saved like a hub checkpoint (no network needed)."""
+    path = tmp_path_factory.mktemp("model")
+    vocab_file = path / "vocab.txt"
+    vocab_file.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *WORDS]) + "\n")
+    transformers.BertTokenizerFast(vocab_file=str(vocab_file)).save_pretrained(path)
+    torch.manual_seed(0)
+    config = transformers.BertConfig(vocab_size=len(WORDS) + 5, hidden_size=128, num_hidden_layers=2, num_attention_heads=4, intermediate_size=256, max_position_embeddings=128)
+    transformers.BertModel(config).save_pretrained(path)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def texts():
+    rng = random.Random(0)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(3, 60))) for _ in range(64)]
+
+
+def embed(backend, model_dir, texts):
+    service = EmbeddingService(model_manager=StaticManager(load_backend(backend, model_dir)))
+    service.cache = None
+    return service.embed(texts)
+
+
+def cosines(reference, other):
+    return np.sum(reference * other, axis=1) / (np.linalg.norm(reference, axis=1) * np.linalg.norm(other, axis=1))
+
+
+@pytest.fixture(scope="module")
+def reference(model_dir, texts):
+    return embed("torch", model_dir, texts)
+
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx"])
+def test_backend_matches_torch_fp32(backend, model_dir, texts, reference, tmp_path, monkeypatch):
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+        monkeypatch.setattr(settings, "onnx_cache_dir", str(tmp_path))
+
+    vectors = embed(backend, model_dir, texts)
+
+    assert vectors.shape == reference.shape
+    assert cosines(reference, vectors).min() >= MIN_COSINE
+
+
+def test_backend_switch_misses_the_cache(model_dir, texts, monkeypatch):
+    cache = EmbeddingCache(redis_client=None)
+    torch_service = EmbeddingService(model_manager=StaticManager(load_backend("torch", model_dir)), cache=cache)
+    torch_service.embed(texts)
+    monkeypatch.setattr(settings, "embedding_backend", "torch-int8")
+    int8_service = EmbeddingService(model_manager=StaticManager(load_backend("torch-int8", model_dir)), cache=cache)
+    misses = cache.misses
+
+    vectors = int8_service.embed(texts)
+
+    assert cache.misses - misses == len(texts)
+    assert int8_service.vector_namespace != torch_service.vector_namespace
+    assert np.array_equal(vectors, embed("torch-int8", model_dir, texts))
@@ -0,0 +1,68 @@
+import pytest
+
+from app.pdf.chunker import RecursiveChunker
+
+
+def word_count(texts):
+    return [len(text.split()) for text in texts]
+
+
+def char_count(texts):
+    return [len(text.strip()) for text in texts]
+
+
+def words(count, start=0):
+    return " ".join(f"w{i}" for i in range(start, start + count))
+
+
+def lines(count, start=0):
+    """Lines of two words, so pieces are lines as long as they fit."""
+    return "\n".join(words(2, i) for i in range(start, start + count, 2))
+
+
+def test_no_chunk_exceeds_chunk_size():
+    chunker = RecursiveChunker(length_function=word_count, chunk_size=10, chunk_overlap=3)
+    pages = [(1, words(37)), (2, f"{words(5, 37)}\n\n{words(21, 42)}. {words(8, 63)}")]
+
+    chunks = list(chunker.chunk_pages(pages))
+
+    assert len(chunks) > 1
+    assert all(len(chunk.text.split()) <= 10 for chunk in chunks)
+    # every word is in some chunk, in order
+    seen = [word.rstrip(".") for chunk in chunks for word in chunk.text.split()]
+    assert list(dict.fromkeys(seen)) == [f"w{i}" for i in range(71)]
+
+
+def test_overlap_is_carried_over():
+    chunker = RecursiveChunker(length_function=word_count, chunk_size=10, chunk_overlap=3)
+
+    chunks = list(chunker.chunk_pages([(1, words(30))]))
+
+    assert len(chunks) >= 3
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.text.split()[:3] == previous.text.split()[-3:]
+
+
+def test_page_range_of_chunks_spanning_pages():
+    chunker = RecursiveChunker(length_function=word_count, chunk_size=6, chunk_overlap=0)
+
+    chunks = list(chunker.chunk_pages([(1, lines(4)), (2, ""), (3, lines(4, 4)), (4, lines(4, 8))]))
+
+    assert [chunk.text.split() for chunk in chunks] == [[f"w{i}" for i in range(6)], [f"w{i}" for i in range(6, 12)]]
+    assert [(chunk.page_start, chunk.page_end) for chunk in chunks] == [(1, 3), (3, 4)]
+    assert "w3\nw4" in chunks[0].text  # the last word of a page is not glued to the next one
+
+
+def test_word_longer_than_chunk_size():
+    chunker = RecursiveChunker(length_function=char_count, chunk_size=5, chunk_overlap=0)
+    word = "abcdefghijklmnopqrstuvw"
+
+    chunks = list(chunker.chunk_pages([(1, f"ab {word} cd")]))
+
+    assert all(len(chunk.text.replace(" ", "")) <= 5 for chunk in chunks)
+    assert "".join(chunk.text.replace(" ", "") for chunk in chunks) == f"ab{word}cd"
+
+
+def test_overlap_must_be_smaller_than_chunk_size():
+    with pytest.raises(ValueError):
+        RecursiveChunker(length_function=word_count, chunk_size=5, chunk_overlap=5)
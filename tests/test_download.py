@@ -0,0 +1,98 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("httpx")
+pytest.importorskip("prometheus_client")
+
+from app.pdf import download as download_module  # noqa: E402
+from app.pdf.download import DownloadRejected, download_document  # noqa: E402
+from app.settings import settings  # noqa: E402
+
+
+class Origin:
+    """Current body and validators of the served url, and the requests it answered."""
+
+    def __init__(self):
+        self.requests = []
+        self.publish(b"%PDF-1.4 first version\n" * 1000, '"v1"', "Mon, 05 Aug 2024 10:00:00 GMT")
+
+    def publish(self, body, etag, last_modified):
+        self.body, self.etag, self.last_modified = body, etag, last_modified
+
+
+@pytest.fixture
+def origin(tmp_path, monkeypatch):
+    state = Origin()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state.requests.append(dict(self.headers))
+            if self.headers.get("If-None-Match") == state.etag or self.headers.get("If-Modified-Since") == state.last_modified:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(state.body)))
+            self.send_header("ETag", state.etag)
+            self.send_header("Last-Modified", state.last_modified)
+            self.end_headers()
+            self.wfile.write(state.body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(settings, "pdfs_data_dir", str(tmp_path / "pdfs"))
+    monkeypatch.setattr(settings, "download_max_bytes", 1024 * 1024)
+    state.url = f"http://127.0.0.1:{server.server_port}/document.pdf"
+    yield state
+    download_module.close_http_client()
+    server.shutdown()
+
+
+def test_download_stores_the_file_under_its_hash(origin):
+    download = download_document(origin.url)
+
+    assert download is not None
+    assert download.file_hash == hashlib.sha256(origin.body).hexdigest()
+    assert os.path.basename(download.file_path) == f"{download.file_hash}.pdf"
+    with open(download.file_path, "rb") as f:
+        assert f.read() == origin.body
+    assert (download.etag, download.last_modified) == (origin.etag, origin.last_modified)
+
+
+def test_unchanged_document_is_not_downloaded_again(origin):
+    first = download_document(origin.url)
+    assert first is not None
+
+    again = download_document(origin.url, etag=first.etag, last_modified=first.last_modified)
+
+    assert again is None
+    assert origin.requests[-1]["If-None-Match"] == first.etag
+    assert os.listdir(settings.pdfs_data_dir) == [os.path.basename(first.file_path)]
+
+
+def test_changed_document_is_downloaded_again(origin):
+    first = download_document(origin.url)
+    assert first is not None
+    origin.publish(b"%PDF-1.4 second version\n" * 1000, '"v2"', "Tue, 06 Aug 2024 10:00:00 GMT")
+
+    second = download_document(origin.url, etag=first.etag, last_modified=first.last_modified)
+
+    assert second is not None
+    assert second.file_hash == hashlib.sha256(origin.body).hexdigest() != first.file_hash
+    assert second.etag == '"v2"'
+    assert os.path.isfile(first.file_path)  # the previous version is never overwritten
+
+
+def test_too_large_document_is_rejected(origin, monkeypatch):
+    monkeypatch.setattr(settings, "download_max_bytes", len(origin.body) // 2)
+
+    with pytest.raises(DownloadRejected):
+        download_document(origin.url)
+    assert os.listdir(settings.pdfs_data_dir) == []
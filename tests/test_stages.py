@@ -0,0 +1,173 @@
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+dramatiq = pytest.importorskip("dramatiq")
+
+from dramatiq.brokers.stub import StubBroker  # noqa: E402
+from dramatiq.middleware import AgeLimit, Callbacks, GroupCallbacks, Pipelines, Retries, TimeLimit  # noqa: E402
+from dramatiq.rate_limits.backends import StubBackend  # noqa: E402
+
+from app.pdf.download import DownloadRejected  # noqa: E402
+from app.models.document import DocumentEventsEnum, DocumentStatusEnum  # noqa: E402
+from app.tasks import document as stages  # noqa: E402
+
+
+class FakeCrud:
+    """The crud functions the stages call, for one document kept in memory."""
+
+    def __init__(self, status):
+        self.document = SimpleNamespace(id=1, status=status, url=None, file_path=None, file_hash=None, etag=None, last_modified=None)
+
+    def get_document(self, db_session, document_id):
+        return self.document
+
+    def update_document_status(self, db_session, document_id, status):
+        self.document.status = status
+
+    def delete_staged_chunks(self, db_session, document_id):
+        pass
+
+    def get_unembedded_staged_chunks(self, db_session, document_id, limit):
+        return []
+
+    def promote_staged_chunks(self, db_session, document_id):
+        return 0
+
+
+def flaky(failures, result=None):
+    """A function raising on its first `failures` calls, then returning `result`."""
+    calls = []
+
+    def call(*args, **kwargs):
+        calls.append(args)
+        if len(calls) <= failures:
+            raise ConnectionError("transient")
+        return result
+
+    call.calls = calls
+    return call
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = StubBroker(middleware=[AgeLimit(), TimeLimit(), Callbacks(), Pipelines(), Retries(), GroupCallbacks(StubBackend())])
+    broker.emit_after("process_boot")
+    for actor in [value for value in vars(stages).values() if isinstance(value, dramatiq.Actor)]:
+        monkeypatch.setattr(actor, "broker", broker)
+        monkeypatch.setitem(actor.options, "min_backoff", 10)
+        monkeypatch.setitem(actor.options, "max_backoff", 20)
+        broker.declare_actor(actor)
+    previous = dramatiq.get_broker()
+    dramatiq.set_broker(broker)
+    worker = dramatiq.Worker(broker, worker_timeout=50)
+    worker.start()
+    yield broker
+    worker.stop()
+    dramatiq.set_broker(previous)
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """Events the stages fire, instead of moving the document forward."""
+    fired = []
+    monkeypatch.setattr(stages, "move_document_forward", lambda document_id, event, **kwargs: fired.append(event))
+    monkeypatch.setattr(stages, "db_context", contextmanager(lambda: (yield None)))
+    monkeypatch.setattr(stages, "clear_progress", lambda document_id: None)
+    return fired
+
+
+def drain(broker):
+    while any(queue.unfinished_tasks for queue in broker.queues.values()):
+        for queue_name in [name for name in broker.queues if not name.endswith(".DQ")]:
+            broker.join(queue_name, timeout=10000)
+
+
+def test_stage_failing_once_is_retried_without_failing_the_document(broker, events, monkeypatch):
+    crud = FakeCrud(DocumentStatusEnum.READY_TO_BE_INDEXED)
+    crud.promote_staged_chunks = flaky(1, result=0)
+    monkeypatch.setattr(stages, "crud", crud)
+
+    stages.embed_document.send(document_id=1)
+    drain(broker)
+
+    assert len(crud.promote_staged_chunks.calls) == 2
+    assert events == [DocumentEventsEnum.EMBEDDING_FINISHED.value]
+
+
+def test_stage_out_of_retries_fails_the_document(broker, events, monkeypatch):
+    monkeypatch.setattr(stages, "crud", FakeCrud(DocumentStatusEnum.ADDED))
+    monkeypatch.setitem(stages.download_and_chunk_document.options, "max_retries", 1)
+
+    stages.download_and_chunk_document.send(document_id=1)
+    drain(broker)
+
+    assert events == [DocumentEventsEnum.LOAD_FAILED.value]
+
+
+def test_rejected_download_fails_the_document_without_retries(broker, events, monkeypatch):
+    crud = FakeCrud(DocumentStatusEnum.ADDED)
+    crud.document.url = "http://example.com/document.pdf"
+    monkeypatch.setattr(stages, "crud", crud)
+    calls = []
+
+    def download_document(url, **kwargs):
+        calls.append(url)
+        raise DownloadRejected("too large")
+
+    monkeypatch.setattr(stages, "download_document", download_document)
+
+    stages.download_and_chunk_document.send(document_id=1)
+    drain(broker)
+
+    assert len(calls) == 1
+    assert events == [DocumentEventsEnum.LOAD_FAILED.value]
+
+
+def test_shard_failing_once_does_not_fail_the_document(broker, events, monkeypatch):
+    monkeypatch.setattr(stages, "crud", FakeCrud(DocumentStatusEnum.LOAD))
+    monkeypatch.setattr(stages.settings, "index_shard_pages", 2)
+    monkeypatch.setattr(stages, "start_progress", lambda document_id, page_count: None)
+    shards_done = []
+    monkeypatch.setattr(stages, "mark_shard_done", lambda document_id, shard, pages: shards_done.append(shard))
+    staged = []
+
+    def stage_pages(db_session, document_id, file_path, start_page, stop_page):
+        staged.append(start_page)
+        if start_page == 2 and staged.count(2) == 1:
+            raise ConnectionError("transient")
+        return 1
+
+    monkeypatch.setattr(stages, "stage_pages", stage_pages)
+
+    stages.send_shards(1, 6)
+    drain(broker)
+
+    assert sorted(staged) == [0, 2, 2, 4]
+    assert sorted(shards_done) == [0, 2, 4]
+    assert events == [DocumentEventsEnum.LOAD_FINISHED.value]
+
+
+@pytest.mark.parametrize("download", [DownloadRejected("status 404"), None], ids=["rejected", "unchanged"])
+def test_indexed_document_keeps_its_version_when_not_downloaded_again(broker, events, monkeypatch, tmp_path, download):
+    crud = FakeCrud(DocumentStatusEnum.INDEXED)
+    crud.document.url = "http://example.com/document.pdf"
+    crud.document.file_path = str(tmp_path / "document.pdf")
+    (tmp_path / "document.pdf").write_bytes(b"%PDF-1.4")
+    monkeypatch.setattr(stages, "crud", crud)
+    statuses = []
+    monkeypatch.setattr(crud, "update_document_status", lambda db_session, document_id, status: statuses.append(status))
+
+    def download_document(url, **kwargs):
+        if isinstance(download, Exception):
+            raise download
+        return download
+
+    monkeypatch.setattr(stages, "download_document", download_document)
+
+    stages.download_and_chunk_document.send(document_id=1)
+    drain(broker)
+
+    assert statuses == []
+    assert events == []
@@ -0,0 +1,33 @@
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("requests")
+
+from app.request_test.bench_startup import measure_import  # noqa: E402
+
+# same default as bench_startup --import-budget-s
+IMPORT_BUDGET_S = 5.0
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope="module")
+def importable():
+    result = subprocess.run([sys.executable, "-c", "import app.main"], capture_output=True, text=True, cwd=ROOT)
+    if "ModuleNotFoundError" in result.stderr:
+        pytest.skip(f"dependencies of app.main are missing: {result.stderr.strip().splitlines()[-1]}")
+    assert result.returncode == 0, result.stderr
+
+
+def test_import_does_not_load_the_model(importable):
+    code = "import app.main\nfrom app.huggingface.manager import ModelManager\nassert not ModelManager().is_loaded, 'the model was loaded at import time'"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    assert result.returncode == 0, result.stderr
+
+
+def test_import_time_within_budget(importable, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    assert statistics.median(measure_import(3)) <= IMPORT_BUDGET_S